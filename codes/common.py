@@ -0,0 +1,265 @@
+# common.py
+"""
+Codice condiviso da cv_search_app_v1.py, embedding_generators/rag_bge-m3_v2.py
+ed embedding_server.py: scrittura bufferizzata dei log, opzioni da riga di
+comando, client del server di embedding, cache degli embedding di sezione e
+punteggio sull'indice int8.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import hashlib
+import sqlite3
+import threading
+import urllib.request
+from pathlib import Path
+import numpy as np
+
+
+# Livelli di log: i messaggi sotto la soglia non vengono né scritti né stampati
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class BufferedLogWriter:
+    """
+    Scrittura asincrona e bufferizzata di un file di log.
+
+    write() mette la riga in coda e ritorna subito; un thread di background
+    scrive a blocchi (una sola apertura del file ogni flush_interval secondi
+    o max_batch righe). Con max_bytes > 0 il file viene ruotato in
+    <file>.1 ... <file>.<backup_count> quando supera la dimensione. close()
+    (registrata con atexit) scrive le righe ancora in coda prima dell'uscita.
+    """
+    def __init__(self, log_file, flush_interval=0.5, max_batch=500, max_bytes=0, backup_count=3):
+        self.log_file = Path(log_file)
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, line):
+        if not self._closed:
+            self._queue.put(line)
+
+    def flush(self, timeout=5):
+        """Attende che le righe in coda siano scritte su disco"""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Raccoglie altre righe fino a max_batch o alla scadenza (flush/stop: subito)
+            while len(batch) < self.max_batch and isinstance(batch[-1], str):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            lines = [item for item in batch if isinstance(item, str)]
+            if lines:
+                self._write(lines)
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, lines):
+        data = "\n".join(lines) + "\n"
+        try:
+            if (self.max_bytes > 0 and self.log_file.exists()
+                    and self.log_file.stat().st_size + len(data) > self.max_bytes):
+                self._rotate()
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Scrittura log non riuscita ({self.log_file.name}): {e}")
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            older = self.log_file.with_name(f"{self.log_file.name}.{i}")
+            if older.exists():
+                older.replace(self.log_file.with_name(f"{self.log_file.name}.{i + 1}"))
+        if self.backup_count > 0:
+            self.log_file.replace(self.log_file.with_name(f"{self.log_file.name}.1"))
+        else:
+            self.log_file.unlink()
+
+
+def file_fingerprint(path):
+    """
+    SHA-256 del contenuto di un file (None se assente).
+
+    Usato sul manifest degli embeddings: gli indici derivati (HNSW) salvano
+    l'impronta della build da cui sono stati creati e l'app li scarta se
+    non corrisponde più.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def get_cli_option(name, default):
+    """Legge un'opzione --name=valore dalla riga di comando (tipo dal default)"""
+    prefix = f"--{name}="
+    for arg in sys.argv[1:]:
+        if arg.startswith(prefix):
+            return type(default)(arg[len(prefix):])
+    return default
+
+
+class RemoteBGEM3Model:
+    """
+    Client del server di embedding opzionale (codes/embedding_server.py).
+
+    encode() ha la stessa interfaccia di BGEM3FlagModel (restituisce solo
+    'dense_vecs'), quindi il client sostituisce il modello in-process senza
+    altre modifiche. I testi vengono inviati a blocchi di chunk_size.
+    """
+    def __init__(self, base_url, model_name, timeout=600, chunk_size=1024):
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def connect(cls, model_name, base_url=None, timeout=1.0):
+        """
+        Client se il server risponde con lo stesso modello, altrimenti None.
+
+        URL da BGE_M3_SERVER_URL (default http://127.0.0.1:8765); "off" lo disattiva.
+        """
+        url = base_url or os.environ.get("BGE_M3_SERVER_URL", "http://127.0.0.1:8765")
+        if url.strip().lower() in ("", "off", "none"):
+            return None
+        try:
+            with urllib.request.urlopen(f"{url.rstrip('/')}/health", timeout=timeout) as response:
+                info = json.loads(response.read())
+        except (OSError, ValueError):
+            return None
+        if info.get("model") != model_name:
+            return None
+        return cls(url, model_name)
+
+    def encode(self, texts, batch_size=12, max_length=8192, **kwargs):
+        texts = list(texts)
+        chunks = []
+        for start in range(0, len(texts), self.chunk_size):
+            body = json.dumps({
+                "texts": texts[start:start + self.chunk_size],
+                "batch_size": batch_size,
+                "max_length": max_length,
+            }).encode('utf-8')
+            request = urllib.request.Request(f"{self.base_url}/encode", data=body,
+                                             headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                rows = int(response.headers["X-Rows"])
+                dim = int(response.headers["X-Dim"])
+                chunks.append(np.frombuffer(response.read(), dtype=np.float32).reshape(rows, dim))
+        dense = np.vstack(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+        return {"dense_vecs": dense}
+
+
+class SectionEmbeddingCache:
+    """
+    Cache persistente testo → embedding (SQLite), indirizzata per contenuto.
+    
+    Scritta dall'indicizzatore, così le stringhe ricorrenti ("Nessuna
+    competenza specificata", ...) vengono codificate una sola volta per
+    modello; l'app di ricerca la legge soltanto.
+    """
+    def __init__(self, db_path, model_name):
+        self.db_path = Path(db_path)
+        self.model_name = model_name
+        self.db_path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def get_many(self, texts):
+        """Ritorna {testo: vettore float32} per i testi presenti in cache"""
+        keys = {self.text_key(text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                    [self.model_name] + chunk
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[keys[text_hash]] = np.frombuffer(blob, dtype=np.float32)
+        return found
+    
+    def put_many(self, vectors_by_text):
+        """Salva {testo: vettore} in cache"""
+        rows = [
+            (self.model_name, self.text_key(text), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in vectors_by_text.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+    
+    def clear(self):
+        """Elimina le voci del modello corrente"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def score_int8(codes, scale, query, chunk_rows=16384):
+    """
+    Prodotto scalare approssimato query · (codes * scale), a blocchi di righe
+    per non materializzare l'intera matrice in float32.
+    """
+    query_scaled = (np.asarray(query, dtype=np.float32) * scale).astype(np.float32)
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), chunk_rows):
+        chunk = np.asarray(codes[start:start + chunk_rows], dtype=np.float32)
+        scores[start:start + chunk_rows] = chunk @ query_scaled
+    return scores
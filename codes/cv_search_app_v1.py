@@ -6,22 +6,28 @@ pip install customtkinter
 
 import customtkinter as ctk
 import threading
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from sklearn.decomposition import PCA
+import queue
+import multiprocessing
 from tkinter import messagebox
 import numpy as np
-from FlagEmbedding import BGEM3FlagModel
-from sklearn.metrics.pairwise import cosine_similarity
 import os
+import io
 import json
 import re
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
-from pptx import Presentation
-from pptx.util import Pt
-from pptx.enum.text import PP_ALIGN
-import requests
+from common import (LOG_LEVELS, BufferedLogWriter, RemoteBGEM3Model, SectionEmbeddingCache,
+                    file_fingerprint, score_int8)
+
+# Moduli pesanti importati al primo uso, così la finestra compare subito:
+# FlagEmbedding (torch) in _load_model_background, matplotlib/sklearn in
+# plot_pca_3d, python-pptx nei generatori/estrattore, requests in OllamaClient
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # → RAG/
 
@@ -29,24 +35,432 @@ BASE_DIR = Path(__file__).resolve().parent.parent  # → RAG/
 ctk.set_appearance_mode("dark")  # "dark" o "light"
 ctk.set_default_color_theme("blue")  # "blue", "green", "dark-blue"
 
+
+class QueueLogWriter:
+    """
+    Writer dei processi worker: inoltra le righe al processo principale.
+
+    Solo il processo principale scrive e ruota cv_search_log.txt (vedi
+    Logger.start_queue_listener); i worker non aprono mai il file.
+    """
+    def __init__(self, log_queue):
+        self.log_queue = log_queue
+
+    def write(self, line):
+        self.log_queue.put(line)
+
+    def flush(self, timeout=5):
+        pass
+
+
 class Logger:
-    """Gestisce il logging su file"""
+    """
+    Gestisce il logging su file.
+
+    La scrittura è asincrona (BufferedLogWriter) con rotazione a 5 MB;
+    la soglia si imposta con CV_SEARCH_LOG_LEVEL (default INFO, DEBUG per
+    il dettaglio della generazione PPTX). Nei processi del pool PPTX le
+    righe passano da una coda al processo principale (QueueLogWriter).
+    """
+    _writers = {}  # un writer per file e per processo, condiviso dalle istanze
+    
     def __init__(self, log_file="cv_search_log.txt"):
         self.log_file = str(BASE_DIR / "log_executions" / "cv_search_log.txt")
+        self.min_level = LOG_LEVELS.get(os.environ.get("CV_SEARCH_LOG_LEVEL", "INFO").upper(), 20)
+        key = (os.getpid(), self.log_file)
+        if key not in Logger._writers:
+            Logger._writers[key] = BufferedLogWriter(self.log_file, max_bytes=5 * 1024 * 1024, backup_count=3)
+        self.writer = Logger._writers[key]
         self.log_to_file(f"\n{'='*80}\nNuova sessione iniziata: {datetime.now()}\n{'='*80}\n")
     
+    def start_queue_listener(self, mp_context=None):
+        """
+        Crea la coda per i log dei processi worker (nel contesto mp_context,
+        default quello di sistema) e il thread che la svuota nel writer di
+        questo processo. Ritorna la coda (None la chiude).
+        """
+        log_queue = (mp_context or multiprocessing).Queue()
+
+        def forward():
+            for line in iter(log_queue.get, None):
+                self.writer.write(line)
+
+        threading.Thread(target=forward, daemon=True).start()
+        return log_queue
+    
     def log_to_file(self, message):
-        """Scrive sul file di log"""
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f"{message}\n")
+        """Scrive sul file di log (in coda, senza attendere il disco)"""
+        self.writer.write(message)
     
     def log(self, message, level="INFO"):
         """Log con timestamp"""
+        if LOG_LEVELS.get(level, 20) < self.min_level:
+            return
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_msg = f"[{timestamp}] [{level}] {message}"
         self.log_to_file(log_msg)
         print(log_msg)
 
+# Schema JSON della valutazione di un candidato (campo "format" di Ollama)
+LLM_EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 0, "maximum": 100},
+        "strengths": {"type": "array", "items": {"type": "string"}},
+        "gaps": {"type": "array", "items": {"type": "string"}},
+        "verdict": {"type": "string", "enum": ["IDONEO", "DA_VALUTARE", "NON_IDONEO"]}
+    },
+    "required": ["score", "strengths", "gaps", "verdict"]
+}
+
+# Schema JSON della risposta in modalità multi-candidato: stessa valutazione più l'id
+LLM_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "candidates": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, **LLM_EVALUATION_SCHEMA["properties"]},
+                "required": ["id"] + LLM_EVALUATION_SCHEMA["required"]
+            }
+        }
+    },
+    "required": ["candidates"]
+}
+
+
+def format_llm_evaluation(evaluation):
+    """Converte una valutazione strutturata nel testo mostrato nei risultati"""
+    strengths = "\n".join(f"   • {item}" for item in evaluation.get("strengths", [])) or "   -"
+    gaps = "\n".join(f"   • {item}" for item in evaluation.get("gaps", [])) or "   -"
+    return (f"1. VALUTAZIONE: {evaluation.get('score', 'N/A')}\n"
+            f"2. PUNTI FORZA:\n{strengths}\n"
+            f"3. GAP:\n{gaps}\n"
+            f"4. ESITO: {evaluation.get('verdict', 'N/A')}")
+
+
+class LLMEvaluation:
+    """
+    Valutazione LLM di un candidato: punteggio, esito, punti di forza e gap.
+
+    Costruita dalla risposta JSON di Ollama oppure, per risposte a testo
+    libero (streaming, cache di versioni precedenti), estraendo VALUTAZIONE
+    ed ESITO dal testo. score è None se il punteggio non è disponibile
+    (errori, analisi interrotte).
+    """
+
+    VERDICTS = ("NON_IDONEO", "DA_VALUTARE", "IDONEO")
+
+    def __init__(self, text, score=None, verdict=None, strengths=None, gaps=None):
+        self.text = text
+        self.score = score
+        self.verdict = verdict
+        self.strengths = strengths or []
+        self.gaps = gaps or []
+
+    @classmethod
+    def from_response(cls, response):
+        """Interpreta la risposta LLM (JSON strutturato o testo libero)"""
+        try:
+            data = json.loads(response)
+        except (TypeError, ValueError):
+            data = None
+
+        if isinstance(data, dict):
+            score = data.get("score")
+            return cls(format_llm_evaluation(data),
+                       score=max(0, min(100, int(score))) if isinstance(score, (int, float)) else None,
+                       verdict=data.get("verdict") if data.get("verdict") in cls.VERDICTS else None,
+                       strengths=[str(item) for item in data.get("strengths", [])],
+                       gaps=[str(item) for item in data.get("gaps", [])])
+
+        text = str(response)
+        score_match = re.search(r'VALUTAZIONE\W*(\d{1,3})', text, re.IGNORECASE)
+        verdict_match = re.search(r'ESITO\W*(NON[_ ]IDONEO|DA[_ ]VALUTARE|IDONEO)', text, re.IGNORECASE)
+        return cls(text,
+                   score=min(100, int(score_match.group(1))) if score_match else None,
+                   verdict=verdict_match.group(1).upper().replace(" ", "_") if verdict_match else None)
+
+    def __str__(self):
+        return self.text
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU degli embedding delle query, con livello opzionale su disco.
+    
+    La chiave è calcolata sulle 4 sezioni normalizzate prodotte da
+    query_json_to_sections (minuscolo, spazi compressi) più il nome del
+    modello: query uguali o che differiscono solo per maiuscole/spazi
+    riusano lo stesso embedding senza passare da BGE-M3.
+    """
+    def __init__(self, model_name, max_size=256, cache_dir=None, max_disk_entries=5000):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            self.cache_dir.mkdir(exist_ok=True, parents=True)
+    
+    def make_key(self, sections):
+        """Chiave stabile dalle sezioni normalizzate"""
+        normalized = [
+            f"{name}={' '.join(sections[name].split()).casefold()}"
+            for name in ['skills', 'experience', 'education', 'summary']
+        ]
+        payload = "\n".join([self.model_name] + normalized)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """Ritorna l'embedding in cache (memoria, poi disco) o None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        
+        if self.cache_dir:
+            cache_file = self.cache_dir / f"{key}.npy"
+            if cache_file.exists():
+                try:
+                    embedding = np.load(str(cache_file))
+                except Exception:
+                    return None
+                self._put_memory(key, embedding)
+                return embedding
+        return None
+    
+    def put(self, key, embedding):
+        """Salva l'embedding in memoria e, se configurato, su disco"""
+        self._put_memory(key, embedding)
+        if self.cache_dir:
+            try:
+                np.save(str(self.cache_dir / f"{key}.npy"), embedding)
+                self._prune_disk()
+            except Exception:
+                pass  # il livello su disco è opzionale
+    
+    def _put_memory(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def _prune_disk(self):
+        """Rimuove i file più vecchi oltre max_disk_entries"""
+        files = list(self.cache_dir.glob("*.npy"))
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=lambda f: f.stat().st_mtime)
+        for old_file in files[:len(files) - self.max_disk_entries]:
+            old_file.unlink(missing_ok=True)
+
+
+class LLMEvaluationCache:
+    """
+    Cache persistente (SQLite) delle valutazioni LLM dei candidati.
+    
+    Chiave: modello + query normalizzata + hash del JSON del candidato, quindi
+    un CV modificato o una query diversa producono una nuova valutazione.
+    Le voci scadono dopo ttl_seconds; oltre max_entries vengono eliminate
+    quelle usate meno di recente.
+    """
+    def __init__(self, db_path, ttl_seconds=7 * 24 * 3600, max_entries=5000):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.db_path.parent.mkdir(exist_ok=True, parents=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS evaluations ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, created REAL NOT NULL, "
+            "last_access REAL NOT NULL, response TEXT NOT NULL)"
+        )
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model, query, cv_data):
+        normalized_query = " ".join(query.split()).casefold()
+        cv_hash = hashlib.sha256(
+            json.dumps(cv_data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        return hashlib.sha256(f"{model}\n{normalized_query}\n{cv_hash}".encode('utf-8')).hexdigest()
+    
+    def get(self, model, query, cv_data):
+        """Ritorna la valutazione in cache (non scaduta) o None"""
+        key = self.make_key(model, query, cv_data)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM evaluations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM evaluations WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE evaluations SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+    
+    def put(self, model, query, cv_data, response):
+        """Salva una valutazione ed applica scadenza ed eviction per dimensione"""
+        key = self.make_key(model, query, cv_data)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO evaluations (key, model, created, last_access, response) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, now, now, response)
+            )
+            self._conn.execute("DELETE FROM evaluations WHERE created < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM evaluations WHERE key IN ("
+                "SELECT key FROM evaluations ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+
+class OllamaClient:
+    """
+    Client Ollama con sessione HTTP persistente (connessioni riusate).
+    
+    Ogni richiesta passa keep_alive, così il modello resta caricato tra un
+    candidato e l'altro; warm_up() lo carica in anticipo all'avvio dell'app.
+    """
+    def __init__(self, base_url=None, keep_alive=None, pool_size=4, logger=None):
+        host = base_url or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+        if not host.startswith(("http://", "https://")):
+            host = f"http://{host}"
+        self.base_url = host.rstrip("/")
+        self.keep_alive = keep_alive or os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+        self.logger = logger
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+    
+    @property
+    def session(self):
+        """Sessione HTTP condivisa, creata al primo uso"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    import requests.adapters
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                            pool_maxsize=max(1, self.pool_size))
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+    
+    def generate(self, model, prompt, options=None, stream=False, timeout=180, format=None):
+        """
+        POST /api/generate; ritorna la Response (in streaming se stream=True).
+        format: "json" o uno schema JSON per output strutturato.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload["options"] = options
+        if format is not None:
+            payload["format"] = format
+        return self.session.post(f"{self.base_url}/api/generate", json=payload,
+                                 stream=stream, timeout=timeout)
+    
+    def warm_up(self, model, timeout=300):
+        """Carica il modello in memoria (richiesta senza prompt); True se pronto"""
+        import requests
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": model, "keep_alive": self.keep_alive},
+                timeout=timeout
+            )
+            if self.logger:
+                self.logger.log(f"Warm-up Ollama {model}: status {response.status_code}")
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            if self.logger:
+                self.logger.log(f"Warm-up Ollama {model} non riuscito: {e}", "WARNING")
+            return False
+    
+    def warm_up_async(self, model):
+        """warm_up() in un thread daemon, senza bloccare la UI"""
+        threading.Thread(target=self.warm_up, args=(model,), daemon=True).start()
+
+
+class BackgroundJobRunner:
+    """
+    Esegue un job lungo in un thread di background senza bloccare Tk.
+
+    Il job non tocca mai i widget: con post() accoda le operazioni sulla
+    UI in una coda thread-safe, svuotata dal thread Tk con root.after ogni
+    poll_ms (al massimo max_messages_per_tick per giro, così la finestra
+    resta reattiva anche con molti messaggi). Un job alla volta;
+    cancel_event viene azzerato all'avvio e il job lo controlla tra un
+    passo e l'altro.
+    """
+
+    def __init__(self, root, poll_ms=50, max_messages_per_tick=500, logger=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.max_messages_per_tick = max_messages_per_tick
+        self.logger = logger
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self._ui_thread = threading.current_thread()
+        self._thread = None
+        self.root.after(self.poll_ms, self._poll)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, target, *args):
+        """Avvia target(*args) in background; False se un job è già in corso"""
+        if self.is_running():
+            return False
+        self.cancel_event.clear()
+        self._thread = threading.Thread(target=target, args=args, daemon=True)
+        self._thread.start()
+        return True
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def post(self, func, *args, **kwargs):
+        """Esegue func nel thread Tk (subito se già nel thread Tk)"""
+        if threading.current_thread() is self._ui_thread:
+            func(*args, **kwargs)
+        else:
+            self.messages.put((func, args, kwargs))
+
+    def _poll(self):
+        # Prossimo giro pianificato prima dei callback: uno lento (o bloccante) non ferma la coda
+        self.root.after(self.poll_ms, self._poll)
+        for _ in range(self.max_messages_per_tick):
+            try:
+                func, args, kwargs = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                if self.logger:
+                    self.logger.log(f"Errore aggiornamento UI: {e}", "ERROR")
+
+
 class PPTXToJSONExtractor:
     """Estrattore PPTX -> JSON"""
     def __init__(self, cv_ppt_folder=None, cv_json_folder=None, logger=None):
@@ -207,6 +621,7 @@ class PPTXToJSONExtractor:
     def extract_info_from_pptx(self, pptx_path):
         """Estrae tutte le informazioni da un file PPTX"""
         try:
+            from pptx import Presentation
             prs = Presentation(str(pptx_path))
             if len(prs.slides) == 0:
                 self.logger.log(f"Nessuna slide in {pptx_path.name}", "WARNING")
@@ -261,6 +676,221 @@ class PPTXToJSONExtractor:
         self.logger.log(f"JSON estratto e salvato: {json_filename.name}")
         return json_filename
 
+class CVDocumentCache:
+    """
+    Cache read-through dei JSON dei candidati (dict già parsati).
+
+    Ogni file viene letto e parsato una volta per sessione e servito dalla
+    memoria ai passi successivi (analisi LLM, generazione PPTX) e alle
+    ricerche seguenti; la voce viene invalidata se il file cambia
+    (mtime/dimensione). LRU limitato a max_size documenti. I dict
+    restituiti sono condivisi: vanno trattati in sola lettura.
+    """
+
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, json_path):
+        path = Path(json_path)
+        stat = path.stat()
+        key = str(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        with self._lock:
+            self._entries[key] = (stamp, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.misses += 1
+        return data
+
+
+class JSONPathIndex:
+    """
+    Indice in memoria riga/label → file JSON del candidato.
+
+    Costruito all'avvio da cv_json_names.npy (allineato alle righe degli
+    embeddings) e da un'unica lettura della cartella JSON. La ricerca per
+    riga o per nome esatto è O(1); per la ricerca approssimata un indice
+    token → file restringe i candidati, con fallback al confronto per
+    sottostringa sui nomi in memoria (stessa regola di find_existing_json).
+    Se un label non viene trovato la cartella viene riletta una volta, per
+    includere i JSON creati nel frattempo (es. estratti da PPTX).
+    """
+
+    def __init__(self, json_folder, json_names=None):
+        self.json_folder = Path(json_folder)
+        self.row_paths = [self.json_folder / f"{name}.json" for name in json_names] if json_names is not None else []
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @staticmethod
+    def normalize(label):
+        return label.lower().strip().replace(' ', '_').replace('.', '_')
+
+    def refresh(self):
+        """Rilegge la cartella JSON e ricostruisce gli indici"""
+        files = sorted(self.json_folder.glob("*.json")) if self.json_folder.exists() else []
+        by_stem = {}
+        tokens = {}
+        for json_file in files:
+            stem = json_file.stem.lower()
+            by_stem.setdefault(stem, json_file)
+            for token in stem.split('_'):
+                if token:
+                    tokens.setdefault(token, set()).add(stem)
+        with self._lock:
+            self._by_stem = by_stem
+            self._tokens = tokens
+            self._stems = sorted(by_stem)
+
+    def add(self, json_file):
+        """Registra un JSON appena creato"""
+        json_file = Path(json_file)
+        stem = json_file.stem.lower()
+        with self._lock:
+            if stem in self._by_stem:
+                return
+            self._by_stem[stem] = json_file
+            for token in stem.split('_'):
+                if token:
+                    self._tokens.setdefault(token, set()).add(stem)
+            self._stems = sorted(self._by_stem)
+
+    def __len__(self):
+        return len(self._by_stem)
+
+    def path_for_row(self, row):
+        """JSON della riga dell'indice embeddings, se esiste ancora"""
+        if 0 <= row < len(self.row_paths) and self.row_paths[row].exists():
+            return self.row_paths[row]
+        return None
+
+    def find(self, label):
+        match = self._lookup(label)
+        if match is None:
+            self.refresh()
+            match = self._lookup(label)
+        return match
+
+    def _lookup(self, label):
+        normalized = self.normalize(label)
+        by_stem = self._by_stem
+        if normalized in by_stem:
+            return by_stem[normalized]
+
+        name_parts = [part for part in normalized.split('_') if part]
+        if not name_parts:
+            return None
+
+        # Prima i file che contengono tutte le parti come token interi
+        token_sets = [self._tokens.get(part) for part in name_parts]
+        if all(token_sets):
+            candidates = set.intersection(*token_sets)
+            if candidates:
+                return by_stem[min(candidates)]
+
+        # Poi confronto per sottostringa, senza rileggere la cartella
+        for stem in self._stems:
+            if all(part in stem for part in name_parts):
+                return by_stem[stem]
+        return None
+
+
+class PPTXTemplateCache:
+    """
+    Cache dei template .pptx: il file viene letto una sola volta.
+
+    Per ogni template tiene in memoria i byte del pacchetto e un piano
+    compilato una volta sola: le shape (slide, shape) che contengono
+    placeholder {{TAG}}, con i tag presenti e i run (paragrafo, run) che li
+    contengono. Ogni CV parte da una copia aperta dai byte in memoria,
+    senza rileggere il file, e le sostituzioni toccano solo quei run. Il
+    template viene ricaricato se cambia sul disco (mtime/dimensione).
+    """
+
+    TAG_PATTERN = re.compile(r'\{\{[A-Z0-9_]+\}\}')
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, template_path):
+        path = Path(template_path)
+        stat = path.stat()
+        key = str(path.resolve())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["stamp"] == (stat.st_mtime_ns, stat.st_size):
+                return entry
+
+            from pptx import Presentation
+            data = path.read_bytes()
+            prs = Presentation(io.BytesIO(data))
+            locations = []
+            for slide_idx, slide in enumerate(prs.slides):
+                for shape_idx, shape in enumerate(slide.shapes):
+                    if not shape.has_text_frame:
+                        continue
+                    tags = set(self.TAG_PATTERN.findall(shape.text_frame.text))
+                    if not tags:
+                        continue
+                    run_positions = [
+                        (paragraph_idx, run_idx)
+                        for paragraph_idx, paragraph in enumerate(shape.text_frame.paragraphs)
+                        for run_idx, run in enumerate(paragraph.runs)
+                        if self.TAG_PATTERN.search(run.text)
+                    ]
+                    locations.append((slide_idx, shape_idx, frozenset(tags), run_positions))
+
+            entry = {"stamp": (stat.st_mtime_ns, stat.st_size), "data": data, "locations": locations}
+            self._entries[key] = entry
+            return entry
+
+    def open(self, template_path):
+        """
+        Nuova copia del template per un CV.
+
+        Ritorna (Presentation, shape_con_tag), con shape_con_tag dizionario
+        {(slide, shape): (shape, insieme dei tag, run con tag)} nell'ordine
+        slide/shape del template.
+        """
+        from pptx import Presentation
+        entry = self._load(template_path)
+        prs = Presentation(io.BytesIO(entry["data"]))
+        slides = prs.slides
+        tagged_shapes = {}
+        for slide_idx, shape_idx, tags, run_positions in entry["locations"]:
+            shape = slides[slide_idx].shapes[shape_idx]
+            paragraphs = shape.text_frame.paragraphs
+            runs = [paragraphs[paragraph_idx].runs[run_idx] for paragraph_idx, run_idx in run_positions]
+            tagged_shapes[(slide_idx, shape_idx)] = (shape, tags, runs)
+        return prs, tagged_shapes
+
+
+# Cache condivisa dai generatori (una per processo)
+TEMPLATE_CACHE = PPTXTemplateCache()
+
+
+@lru_cache(maxsize=32)
+def compile_tag_pattern(tags):
+    """Regex unica per sostituire tutti i tag (tuple) in un solo passaggio"""
+    return re.compile("|".join(re.escape(tag) for tag in sorted(tags, key=len, reverse=True)))
+
+
 class PPTXGeneratorACN1:
     """Generatore PPTX da JSON usando template ACN_1"""
     def __init__(self, template_path, logger=None):
@@ -273,17 +903,20 @@ class PPTXGeneratorACN1:
         if not shape.has_text_frame:
             return
         
+        pattern = compile_tag_pattern(tuple(replacements))
         for paragraph in shape.text_frame.paragraphs:
             for run in paragraph.runs:
-                for tag, val in replacements.items():
-                    if tag in run.text:
-                        run.text = run.text.replace(tag, val)
-                        if tag == "{{NOME}}":
-                            run.font.bold = True
-                run.text = run.text.replace(" - ", " ").replace(" -", "").strip()
+                text = run.text
+                if "{{" in text:
+                    found = set()
+                    text = pattern.sub(lambda m: found.add(m.group(0)) or replacements[m.group(0)], text)
+                    if "{{NOME}}" in found:
+                        run.font.bold = True
+                run.text = text.replace(" - ", " ").replace(" -", "").strip()
     
     def replace_text_with_font_size(self, shape, tag, value, font_size):
         """Sostituisce il testo e imposta una dimensione font specifica"""
+        from pptx.util import Pt
         if not shape.has_text_frame:
             return
         
@@ -299,6 +932,8 @@ class PPTXGeneratorACN1:
     
     def fill_list(self, shape, items):
         """Sostituisce il testo del shape con un elenco puntato"""
+        from pptx.util import Pt
+        from pptx.enum.text import PP_ALIGN
         if not shape.has_text_frame:
             return
         tf = shape.text_frame
@@ -319,8 +954,9 @@ class PPTXGeneratorACN1:
             p.alignment = PP_ALIGN.LEFT
             p.font.bold = False
         
-    def generate_cv(self, json_path, output_path):
+    def generate_cv(self, json_path, output_path, data=None):
         """Genera CV da JSON usando template ACN_1"""
+        from pptx.util import Pt
         self.logger.log(f"Generando CV con template {self.template_name} da: {json_path}")
         
         if not self.template_path.exists():
@@ -328,8 +964,10 @@ class PPTXGeneratorACN1:
             return False
         
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # data: JSON già caricato (CVDocumentCache), evita una seconda lettura
+            if data is None:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
             
             campi = {
                 "{{NOME}}": data.get("name", ""),
@@ -340,58 +978,53 @@ class PPTXGeneratorACN1:
                 "{{DATAFINECERT}}": "",
             }
             
-            prs = Presentation(str(self.template_path))
+            prs, tagged_shapes = TEMPLATE_CACHE.open(self.template_path)
             
-            # STEP 1: Sostituzioni semplici
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    self.replace_text_in_shape(shape, campi)
-            
-            # STEP 2: Gestione BACKGROUND (era RIASSUNTO)
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if shape.has_text_frame and "{{BACKGROUND}}" in shape.text:
-                        self.replace_text_with_font_size(shape, "{{BACKGROUND}}", data.get("summary", ""), 9)
-            
-            # STEP 3: Gestione liste complesse
-            for slide in prs.slides:
-                for shape in slide.shapes:
+            # Un solo passaggio sulle shape: ogni passo lavora sulla singola
+            # shape, quindi applicarli in sequenza shape per shape equivale
+            # ai passaggi separati su tutta la presentazione
+            for slide_idx, slide in enumerate(prs.slides):
+                for shape_idx, shape in enumerate(slide.shapes):
                     if not shape.has_text_frame:
                         continue
                     
-                    text = shape.text
-                    
-                    # SKILLS unificato (era COMPETENZA + TECNOLOGIE)
-                    if "{{SKILLS}}" in text:
-                        all_skills = data.get("skills", []) + data.get("technologies", [])
-                        self.fill_list(shape, all_skills)
-                    
-                    # ESPERIENZE
-                    elif "{{ESPERIENZE}}" in text:
-                        esperienze = [
-                            f"{exp.get('company', '').upper()} ({exp.get('period', '')}):\n{exp.get('description', '')}"
-                            for exp in data.get("experience", [])
-                        ]
-                        self.fill_list(shape, esperienze)
+                    # STEP 1: Sostituzioni semplici (tutte le shape: pulisce anche i " - ")
+                    self.replace_text_in_shape(shape, campi)
                     
-                    # CERTIFICAZIONI
-                    elif "{{CERTIFICAZIONI}}" in text:
-                        certifications = data.get("certifications", [])
-                        if certifications:
-                            cert_list = []
-                            for cert in certifications:
-                                if isinstance(cert, str):
-                                    cert_list.append(cert)
-                                else:
-                                    cert_list.append(cert.get("name", ""))
-                            self.fill_list(shape, cert_list)
-            
-            # STEP 4: Formattazione font (opzionale)
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if not shape.has_text_frame:
-                        continue
+                    if (slide_idx, shape_idx) in tagged_shapes:
+                        # STEP 2: Gestione BACKGROUND (era RIASSUNTO)
+                        if "{{BACKGROUND}}" in shape.text:
+                            self.replace_text_with_font_size(shape, "{{BACKGROUND}}", data.get("summary", ""), 9)
+                        
+                        # STEP 3: Gestione liste complesse
+                        text = shape.text
+                        
+                        # SKILLS unificato (era COMPETENZA + TECNOLOGIE)
+                        if "{{SKILLS}}" in text:
+                            all_skills = data.get("skills", []) + data.get("technologies", [])
+                            self.fill_list(shape, all_skills)
+                        
+                        # ESPERIENZE
+                        elif "{{ESPERIENZE}}" in text:
+                            esperienze = [
+                                f"{exp.get('company', '').upper()} ({exp.get('period', '')}):\n{exp.get('description', '')}"
+                                for exp in data.get("experience", [])
+                            ]
+                            self.fill_list(shape, esperienze)
+                        
+                        # CERTIFICAZIONI
+                        elif "{{CERTIFICAZIONI}}" in text:
+                            certifications = data.get("certifications", [])
+                            if certifications:
+                                cert_list = []
+                                for cert in certifications:
+                                    if isinstance(cert, str):
+                                        cert_list.append(cert)
+                                    else:
+                                        cert_list.append(cert.get("name", ""))
+                                self.fill_list(shape, cert_list)
                     
+                    # STEP 4: Formattazione font (opzionale)
                     full_text = "".join(run.text for p in shape.text_frame.paragraphs for run in p.runs)
                     
                     if "ISTRUZIONE" in full_text and "FORMAZIONE" in full_text:
@@ -427,14 +1060,21 @@ class PPTXGeneratorGeneric:
         if not shape.has_text_frame:
             return
         
-        for paragraph in shape.text_frame.paragraphs:
-            for run in paragraph.runs:
-                for tag, val in replacements.items():
-                    if tag in run.text:
-                        run.text = run.text.replace(tag, str(val))
+        self.replace_text_in_runs(
+            [run for paragraph in shape.text_frame.paragraphs for run in paragraph.runs],
+            replacements)
+    
+    def replace_text_in_runs(self, runs, replacements):
+        """Sostituisce tutti i tag in un solo passaggio per run (una regex combinata)"""
+        pattern = compile_tag_pattern(tuple(replacements))
+        for run in runs:
+            text = run.text
+            if "{{" in text:
+                run.text = pattern.sub(lambda m: str(replacements[m.group(0)]), text)
     
     def fill_list(self, shape, items, as_bullet=True):
         """Riempie con lista di items"""
+        from pptx.util import Pt
         if not shape.has_text_frame:
             return
         
@@ -449,8 +1089,9 @@ class PPTXGeneratorGeneric:
             p.font.size = Pt(11)
             p.font.name = "Arial"
     
-    def generate_cv(self, json_path, output_path):
+    def generate_cv(self, json_path, output_path, data=None):
         """Genera CV da JSON usando template generico"""
+        from pptx.util import Pt
         self.logger.log(f"Generando CV con template {self.template_name} da: {json_path}")
         
         if not self.template_path.exists():
@@ -458,8 +1099,10 @@ class PPTXGeneratorGeneric:
             return False
         
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # data: JSON già caricato (CVDocumentCache), evita una seconda lettura
+            if data is None:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
             
             # ── Mapping unificato (aggiunto {{RUOLO}} come alias di TITOLO) ──
             campi = {
@@ -470,12 +1113,8 @@ class PPTXGeneratorGeneric:
                 "{{FORMAZIONE}}": data.get('education', {}).get('degree', ''),
             }
             
-            prs = Presentation(str(self.template_path))
-            
-            # STEP 1: Sostituzioni semplici
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    self.replace_text_in_shape(shape, campi)
+            # Copia in memoria del template, con le shape che contengono tag
+            prs, tagged_shapes = TEMPLATE_CACHE.open(self.template_path)
             
             # ── Prepara split delle skills ──────────────────────────────
             all_skills = data.get("skills", []) + data.get("technologies", [])
@@ -489,80 +1128,81 @@ class PPTXGeneratorGeneric:
             
             self.logger.log(
                 f"Skills split: col1={len(skills_col1)}, col2={len(skills_col2)} "
-                f"(totale {len(all_skills)})"
+                f"(totale {len(all_skills)})",
+                "DEBUG"
             )
             # ────────────────────────────────────────────────────────────
             
-            # STEP 2: Gestione liste e sezioni complesse
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if not shape.has_text_frame:
-                        continue
-                    
-                    text = shape.text
-                    
-                    # ESPERIENZE
-                    if "{{ESPERIENZE}}" in text:
-                        experiences_text = []
-                        for exp in data.get("experience", []):
-                            exp_line = (
-                                f"• {exp.get('company', '')} "
-                                f"({exp.get('period', '')}): "
-                                f"{exp.get('description', '')}"
-                            )
-                            experiences_text.append(exp_line)
-                        
-                        if experiences_text:
-                            shape.text_frame.clear()
-                            for i, exp_text in enumerate(experiences_text):
-                                p = (shape.text_frame.paragraphs[0]
-                                     if i == 0
-                                     else shape.text_frame.add_paragraph())
-                                p.text = exp_text
-                                p.font.size = Pt(10)
-                                p.font.name = "Arial"
-                        self.logger.log(f"Compilato ESPERIENZE: {len(experiences_text)} items")
-                    
-                    # ── SKILLS SPLIT: colonna 1 ────────────────────────
-                    elif "{{SKILLS1}}" in text:
-                        self.fill_list(shape, skills_col1)
-                        self.logger.log(f"Compilato SKILLS1: {len(skills_col1)} items")
+            # Un solo passaggio sulle shape con tag (piano del template)
+            for shape, _, runs in tagged_shapes.values():
+                # STEP 1: Sostituzioni semplici, solo nei run che contengono tag
+                self.replace_text_in_runs(runs, campi)
+                
+                # STEP 2: Gestione liste e sezioni complesse
+                text = shape.text
+                
+                # ESPERIENZE
+                if "{{ESPERIENZE}}" in text:
+                    experiences_text = []
+                    for exp in data.get("experience", []):
+                        exp_line = (
+                            f"• {exp.get('company', '')} "
+                            f"({exp.get('period', '')}): "
+                            f"{exp.get('description', '')}"
+                        )
+                        experiences_text.append(exp_line)
                     
-                    # ── SKILLS SPLIT: colonna 2 ────────────────────────
-                    elif "{{SKILLS2}}" in text:
-                        if skills_col2:
-                            self.fill_list(shape, skills_col2)
-                            self.logger.log(f"Compilato SKILLS2: {len(skills_col2)} items")
+                    if experiences_text:
+                        shape.text_frame.clear()
+                        for i, exp_text in enumerate(experiences_text):
+                            p = (shape.text_frame.paragraphs[0]
+                                 if i == 0
+                                 else shape.text_frame.add_paragraph())
+                            p.text = exp_text
+                            p.font.size = Pt(10)
+                            p.font.name = "Arial"
+                    self.logger.log(f"Compilato ESPERIENZE: {len(experiences_text)} items", "DEBUG")
+                
+                # ── SKILLS SPLIT: colonna 1 ────────────────────────
+                elif "{{SKILLS1}}" in text:
+                    self.fill_list(shape, skills_col1)
+                    self.logger.log(f"Compilato SKILLS1: {len(skills_col1)} items", "DEBUG")
+                
+                # ── SKILLS SPLIT: colonna 2 ────────────────────────
+                elif "{{SKILLS2}}" in text:
+                    if skills_col2:
+                        self.fill_list(shape, skills_col2)
+                        self.logger.log(f"Compilato SKILLS2: {len(skills_col2)} items", "DEBUG")
+                    else:
+                        # Nessuna skill residua → scrivi blank
+                        shape.text_frame.clear()
+                        p = shape.text_frame.paragraphs[0]
+                        p.text = ""
+                        self.logger.log("SKILLS2: blank (≤ 5 skills totali)", "DEBUG")
+                
+                # ── Retrocompatibilità: tag singolo {{SKILLS}} ─────
+                elif "{{SKILLS}}" in text:
+                    self.fill_list(shape, all_skills)
+                    self.logger.log(f"Compilato SKILLS (singolo): {len(all_skills)} items", "DEBUG")
+                
+                # CERTIFICAZIONI
+                elif "{{CERTIFICAZIONI}}" in text:
+                    certifications = data.get("certifications", [])
+                    cert_list = []
+                    for cert in certifications:
+                        if isinstance(cert, str):
+                            cert_list.append(cert)
                         else:
-                            # Nessuna skill residua → scrivi blank
-                            shape.text_frame.clear()
-                            p = shape.text_frame.paragraphs[0]
-                            p.text = ""
-                            self.logger.log("SKILLS2: blank (≤ 5 skills totali)")
-                    
-                    # ── Retrocompatibilità: tag singolo {{SKILLS}} ─────
-                    elif "{{SKILLS}}" in text:
-                        self.fill_list(shape, all_skills)
-                        self.logger.log(f"Compilato SKILLS (singolo): {len(all_skills)} items")
-                    
-                    # CERTIFICAZIONI
-                    elif "{{CERTIFICAZIONI}}" in text:
-                        certifications = data.get("certifications", [])
-                        cert_list = []
-                        for cert in certifications:
-                            if isinstance(cert, str):
-                                cert_list.append(cert)
-                            else:
-                                cert_list.append(cert.get("name", ""))
-                        self.fill_list(shape, cert_list)
-                        self.logger.log(f"Compilato CERTIFICAZIONI: {len(cert_list)} items")
-                    
-                    # LINGUE
-                    elif "{{LINGUE}}" in text:
-                        lingue = data.get("languages",
-                                          ["Italiano (madrelingua)", "Inglese (fluente)"])
-                        self.fill_list(shape, lingue)
-                        self.logger.log(f"Compilato LINGUE: {len(lingue)} items")
+                            cert_list.append(cert.get("name", ""))
+                    self.fill_list(shape, cert_list)
+                    self.logger.log(f"Compilato CERTIFICAZIONI: {len(cert_list)} items", "DEBUG")
+                
+                # LINGUE
+                elif "{{LINGUE}}" in text:
+                    lingue = data.get("languages",
+                                      ["Italiano (madrelingua)", "Inglese (fluente)"])
+                    self.fill_list(shape, lingue)
+                    self.logger.log(f"Compilato LINGUE: {len(lingue)} items", "DEBUG")
             
             # SALVA
             prs.save(str(output_path))
@@ -574,6 +1214,36 @@ class PPTXGeneratorGeneric:
             return False
 
 
+def is_placeholder_value(value):
+    """True se il valore di un tag è vuoto o segnaposto ('...', '-', '?'): nessun carattere alfanumerico"""
+    return not any(ch.isalnum() for ch in str(value))
+
+
+def top_k_indices(scores, k):
+    """Indici dei k punteggi più alti in ordine decrescente (argpartition, O(N + k log k))"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+def score_dense(embeddings, query, rows=None, chunk_rows=16384):
+    """
+    Prodotto scalare embeddings · query (solo sulle righe rows, se date),
+    a blocchi di righe: con l'indice float16 ogni blocco viene convertito
+    in float32 senza creare una copia float32 dell'intera matrice.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    num_rows = len(embeddings) if rows is None else len(rows)
+    scores = np.empty(num_rows, dtype=np.float32)
+    for start in range(0, num_rows, chunk_rows):
+        block = (embeddings[start:start + chunk_rows] if rows is None
+                 else embeddings[rows[start:start + chunk_rows]])
+        scores[start:start + chunk_rows] = np.asarray(block, dtype=np.float32) @ query
+    return scores
+
+
 def get_available_templates(template_folder=None):
     """Scansiona la cartella template e restituisce i template disponibili"""
     template_path = Path(template_folder) if template_folder else BASE_DIR / "input" / "template"
@@ -596,6 +1266,33 @@ def create_generator_for_template(template_path, logger):
     """Usa sempre il generator generico (tag unificati)"""
     return PPTXGeneratorGeneric(template_path, logger)
 
+
+# Logger dei processi di generazione (uno per processo, creato dall'initializer)
+_generation_logger = None
+
+
+def _init_generation_worker(log_queue):
+    """Initializer del ProcessPoolExecutor di generazione PPTX: log inoltrati al processo principale"""
+    global _generation_logger
+    Logger._writers[(os.getpid(), str(BASE_DIR / "log_executions" / "cv_search_log.txt"))] = QueueLogWriter(log_queue)
+    _generation_logger = Logger()
+
+
+def generate_cv_job(template_path, json_path, output_path, data=None):
+    """
+    Genera un CV in un processo del pool (funzione di modulo, serializzabile).
+
+    data è il JSON già caricato dal processo principale (il worker non
+    rilegge il file). Ritorna (output_path, successo, messaggio di errore o None).
+    """
+    try:
+        generator = create_generator_for_template(Path(template_path), _generation_logger or Logger())
+        if generator.generate_cv(json_path, output_path, data=data):
+            return str(output_path), True, None
+        return str(output_path), False, "Errore nella generazione"
+    except Exception as e:
+        return str(output_path), False, str(e)
+
 class CVSearchApp:
     def __init__(self):
         self.root = ctk.CTk()
@@ -613,11 +1310,46 @@ class CVSearchApp:
         self.selected_template = None
         self.available_templates = []
         self.selected_llm_model = "llama3.2:1b"  # Modello di default
+        # Richieste LLM contemporanee: allineato a OLLAMA_NUM_PARALLEL del server
+        self.llm_max_workers = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+        # Pipeline in background: la UI riceve gli aggiornamenti via coda
+        self.job_runner = BackgroundJobRunner(self.root, logger=self.logger)
+        self.cancel_event = self.job_runner.cancel_event
+        self.llm_batch_size = 4  # candidati per prompt in modalità multi-candidato
+        self.llm_rerank_weight = 0.5  # peso del punteggio LLM nella classifica finale
+        # Generazione PPTX: pool di processi creato al primo uso e riusato;
+        # sotto la soglia si genera nel processo corrente (evita l'avvio dei worker)
+        self.pptx_max_workers = os.cpu_count() or 1
+        self.pptx_process_threshold = 4
+        # spawn anche su Linux: fork da un processo con thread attivi (Tk, log,
+        # job, SQLite) può bloccare il figlio su un lock preso da un altro thread
+        self.pptx_mp_context = multiprocessing.get_context("spawn")
+        self.pptx_pool = None
+        self.pptx_log_queue = None
+        self.ollama = OllamaClient(pool_size=self.llm_max_workers, logger=self.logger)
+        self.llm_cache = LLMEvaluationCache(BASE_DIR / "input" / "embeddings" / "llm_eval_cache.sqlite")
+        self.query_cache = QueryEmbeddingCache(
+            'BAAI/bge-m3',
+            max_size=256,
+            cache_dir=BASE_DIR / "input" / "embeddings" / "query_cache"
+        )
+        self.section_cache = None  # SectionEmbeddingCache, aperta in load_data
+        self.ann_index = None      # indice HNSW opzionale (hnswlib)
+        self.ann_ef_search = 128
+        self.int8_codes = None     # indice compresso int8 opzionale
+        self.int8_scale = None
+        self.int8_rerank_factor = 10
+        self.metadata = None       # colonne Office/Level/title + bitmap (cv_metadata.npz)
+        self.json_index = None     # riga/label → JSON candidato (JSONPathIndex)
+        self.documents = CVDocumentCache()  # JSON candidati già parsati
         
         # Setup UI
         self.setup_ui()
         self.load_templates()
         self.load_data()
+
+        # Carica subito il modello LLM in Ollama (evita lo stallo al primo candidato)
+        self.ollama.warm_up_async(self.selected_llm_model)
     
     def setup_ui(self):
         # Status bar compatto in alto
@@ -678,7 +1410,10 @@ class CVSearchApp:
                                         wrap="word",
                                         height=100)
         self.query_text.pack(fill="x", padx=10, pady=(0, 10))
-        self.query_text.insert("1.0", "Skills: ...\nIndustry: ...\nOffice: ...\n Level: ... ")
+        self.query_text.insert("1.0", "Skills: ...\nIndustry: ...")
+        
+        ctk.CTkLabel(left_column, text="Filtri opzionali: aggiungi una riga 'Office: <sede>' o 'Level: <livello>'",
+                    font=ctk.CTkFont(size=10), text_color="gray").pack(anchor="w", padx=12, pady=(0, 8))
        
         control_content = ctk.CTkFrame(left_column, fg_color="transparent")
         control_content.pack(fill="x", padx=10, pady=(0, 10))
@@ -733,7 +1468,18 @@ class CVSearchApp:
             dropdown_font=ctk.CTkFont(size=10),
             height=32
         )
-        self.llm_combo.pack(fill="x", padx=10, pady=(0, 10))
+        self.llm_combo.pack(fill="x", padx=10, pady=(0, 5))
+
+        # Default senza streaming: il punteggio per la classifica arriva dal JSON strutturato
+        self.llm_stream_var = ctk.BooleanVar(value=False)
+        ctk.CTkSwitch(llm_frame, text="Risposta in streaming (punteggio letto dal testo)",
+                      variable=self.llm_stream_var,
+                      font=ctk.CTkFont(size=11)).pack(anchor="w", padx=10, pady=(0, 5))
+
+        self.llm_batch_var = ctk.BooleanVar(value=False)
+        ctk.CTkSwitch(llm_frame, text=f"Prompt multi-candidato ({self.llm_batch_size} per richiesta)",
+                      variable=self.llm_batch_var,
+                      font=ctk.CTkFont(size=11)).pack(anchor="w", padx=10, pady=(0, 10))
 
         # Label info modello selezionato
         #self.llm_info_label = ctk.CTkLabel(
@@ -819,6 +1565,21 @@ class CVSearchApp:
                                         hover_color=("#36719F", "#144870"))
         self.search_button.pack(fill="x")
 
+        self.cancel_button = ctk.CTkButton(button_frame,
+                                        text="⏹ Interrompi",
+                                        command=self.cancel_event.set,
+                                        font=ctk.CTkFont(size=12),
+                                        height=32,
+                                        corner_radius=8,
+                                        state="disabled",
+                                        fg_color=("#C62828", "#8E1B1B"),
+                                        hover_color=("#8E1B1B", "#5C1010"))
+        self.cancel_button.pack(fill="x", pady=(5, 0))
+
+        self.progress_bar = ctk.CTkProgressBar(button_frame, height=8)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(fill="x", pady=(5, 0))
+
         # Footer info nella colonna destra
         footer_frame = ctk.CTkFrame(right_column, fg_color=("gray85", "gray17"), 
                                 corner_radius=8)
@@ -890,9 +1651,13 @@ class CVSearchApp:
                     value = match.group(1).strip()
                     matched = True
 
+                    # Tag lasciato col segnaposto del testo iniziale ('Skills: ...')
+                    if is_placeholder_value(value):
+                        break
+
                     if field in ("skills", "technologies", "certifications"):
                         items = re.split(r'[,;|]', value)
-                        items = [i.strip() for i in items if i.strip()]
+                        items = [i.strip() for i in items if not is_placeholder_value(i)]
                         query_json[field].extend(items)
 
                     elif field == "summary":
@@ -916,7 +1681,7 @@ class CVSearchApp:
 
                     break
 
-            if not matched:
+            if not matched and not is_placeholder_value(line):
                 unmatched_parts.append(line)
 
         # Testo non riconosciuto → aggiunto al summary
@@ -1053,23 +1818,41 @@ class CVSearchApp:
             weight_pct = weights[section_name] * 100
             self.logger.log(f"  [{weight_pct:.0f}%] {section_name}: {text[:120]}...")
 
-        # 4. Embedding di ogni sezione separatamente
-        section_embeddings = {}
-        for section_name in ['skills', 'experience', 'education', 'summary']:
-            emb = self.model.encode([sections[section_name]])['dense_vecs']
-            section_embeddings[section_name] = emb[0]  # shape: (dim,)
-
-        # 5. Combinazione pesata (identica a create_weighted_embeddings)
-        embedding_dim = section_embeddings['skills'].shape[0]
-        query_embedding = np.zeros(embedding_dim)
-
-        for section_name, weight in weights.items():
-            query_embedding += section_embeddings[section_name] * weight
-
-        # Reshape per compatibilità con cosine_similarity: (1, dim)
-        query_embedding = query_embedding.reshape(1, -1)
-
-        self.logger.log(f"Query embedding shape: {query_embedding.shape}")
+        # 4. Cache LRU: query già viste non passano dal modello
+        cache_key = self.query_cache.make_key(sections)
+        cached_embedding = self.query_cache.get(cache_key)
+        if cached_embedding is not None:
+            self.logger.log("Query embedding da cache")
+            return cached_embedding, query_json, sections
+
+        # 5. Embedding delle 4 sezioni: prima la cache dell'indicizzatore
+        #    (solo lettura: i testi liberi delle query non vi vengono salvati,
+        #    le ripetizioni sono coperte da query_cache), poi un'unica
+        #    chiamata batch per i testi mancanti
+        section_names = ['skills', 'experience', 'education', 'summary']
+        section_texts = [sections[name] for name in section_names]
+        vectors_by_text = self.section_cache.get_many(section_texts) if self.section_cache else {}
+        to_encode = list(dict.fromkeys(t for t in section_texts if t not in vectors_by_text))
+
+        start = time.perf_counter()
+        if to_encode:
+            encoded = self.model.encode(to_encode, batch_size=len(to_encode))['dense_vecs']
+            vectors_by_text.update(zip(to_encode, encoded))
+        encode_ms = (time.perf_counter() - start) * 1000
+        section_matrix = np.vstack([vectors_by_text[t] for t in section_texts])  # (4, dim)
+
+        # 6. Combinazione pesata (identica a create_weighted_embeddings):
+        #    (1, 4) @ (4, dim) → (1, dim)
+        weight_vector = np.array([[weights[name] for name in section_names]])
+        query_embedding = weight_vector @ section_matrix
+
+        # Normalizzazione L2, come gli embeddings dei CV: similarità = prodotto scalare
+        query_embedding /= max(np.linalg.norm(query_embedding), 1e-12)
+        query_embedding = query_embedding.astype(np.float32)
+        self.query_cache.put(cache_key, query_embedding)
+
+        self.logger.log(f"Query embedding shape: {query_embedding.shape} "
+                        f"(encoding: {encode_ms:.0f} ms, {len(to_encode)}/4 sezioni codificate)")
 
         return query_embedding, query_json, sections
 
@@ -1107,6 +1890,7 @@ class CVSearchApp:
         """Callback selezione modello LLM"""
         self.selected_llm_model = choice.strip()
         self.logger.log(f"Modello LLM selezionato: {self.selected_llm_model}")
+        self.ollama.warm_up_async(self.selected_llm_model)
 
         
     def update_template_info(self):
@@ -1137,11 +1921,26 @@ class CVSearchApp:
                 self.logger.log(f"File mancanti: {missing}", "ERROR")
                 return
 
-            # Carica subito i file NPY (veloce, ~100ms)
-            self.cv_embeddings = np.load(str(EMB_DIR / 'cv_embeddings.npy'))
+            # Carica subito i file NPY: gli embeddings (float32/float16 contigui)
+            # sono mappati in memoria, costo di avvio costante al crescere del pool
+            self.cv_embeddings = np.load(str(EMB_DIR / 'cv_embeddings.npy'), mmap_mode='r')
             self.cv_texts = np.load(str(EMB_DIR / 'cv_texts.npy'), allow_pickle=True)
             self.cv_labels = np.load(str(EMB_DIR / 'cv_labels.npy'), allow_pickle=True)
 
+            # Indici generati prima della normalizzazione L2: normalizza in memoria
+            sample_norms = np.linalg.norm(self.cv_embeddings[:100].astype(np.float32), axis=1)
+            if not np.allclose(sample_norms, 1.0, atol=1e-2):
+                self.logger.log("Embeddings non normalizzati: normalizzazione in memoria "
+                                "(rigenera gli embeddings per evitarla)", "WARNING")
+                embeddings = np.asarray(self.cv_embeddings, dtype=np.float32)
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                self.cv_embeddings = embeddings / np.maximum(norms, 1e-12)
+            self.section_cache = SectionEmbeddingCache(EMB_DIR / 'section_cache.sqlite', 'BAAI/bge-m3')
+            self.load_ann_index(EMB_DIR)
+            self.load_quantized_index(EMB_DIR)
+            self.load_metadata(EMB_DIR)
+            self.load_json_index(EMB_DIR)
+
             self.status_label.configure(
                 text=f"⏳ {len(self.cv_labels)} CV caricati — modello in caricamento...",
                 text_color="orange")
@@ -1157,11 +1956,196 @@ class CVSearchApp:
             self.status_label.configure(text="❌ Errore caricamento", text_color="red")
             self.logger.log(f"Errore caricamento: {e}", "ERROR")
 
+    def load_json_index(self, emb_dir):
+        """Costruisce l'indice riga → JSON da cv_json_names.npy (se presente e allineato)"""
+        json_folder = BASE_DIR / "input" / "cv_json"
+        names_file = Path(emb_dir) / 'cv_json_names.npy'
+        json_names = None
+        if names_file.exists():
+            json_names = np.load(str(names_file), allow_pickle=True)
+            if len(json_names) != len(self.cv_labels):
+                self.logger.log("cv_json_names.npy non allineato agli embeddings: "
+                                "solo ricerca per nome", "WARNING")
+                json_names = None
+        self.json_index = JSONPathIndex(json_folder, json_names)
+        self.logger.log(f"Indice JSON: {len(self.json_index.row_paths)} righe, "
+                        f"{len(self.json_index)} file")
+
+    def load_ann_index(self, emb_dir):
+        """
+        Carica l'indice HNSW opzionale creato da rag_bge-m3_v2.py --ann.
+
+        L'indice viene usato solo se la sua impronta coincide con quella di
+        embeddings_manifest.json (stessa build di cv_embeddings.npy).
+        """
+        self.ann_index = None
+        index_file = Path(emb_dir) / 'cv_index_hnsw.bin'
+        meta_file = Path(emb_dir) / 'cv_index_hnsw.json'
+        if not index_file.exists() or not meta_file.exists():
+            return
+
+        try:
+            import hnswlib
+        except ImportError:
+            self.logger.log("Indice ANN presente ma hnswlib non installato: ricerca esatta", "WARNING")
+            return
+
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            fingerprint = file_fingerprint(Path(emb_dir) / 'embeddings_manifest.json')
+            if (meta["count"] != len(self.cv_embeddings) or fingerprint is None
+                    or meta.get("embeddings_fingerprint") != fingerprint):
+                self.logger.log("Indice ANN non allineato agli embeddings: ricerca esatta", "WARNING")
+                return
+
+            index = hnswlib.Index(space=meta.get("space", "ip"), dim=meta["dim"])
+            index.load_index(str(index_file), max_elements=meta["count"])
+            self.ann_ef_search = meta.get("ef_search", 128)
+            index.set_ef(self.ann_ef_search)
+            self.ann_index = index
+            self.logger.log(f"Indice ANN caricato: {meta['count']} CV, "
+                            f"M={meta.get('M')}, ef_search={self.ann_ef_search}")
+        except Exception as e:
+            self.logger.log(f"Errore caricamento indice ANN: {e}", "ERROR")
+
+    def load_quantized_index(self, emb_dir):
+        """Carica i codici int8 opzionali creati da rag_bge-m3_v2.py --quantize"""
+        self.int8_codes = None
+        codes_file = Path(emb_dir) / 'cv_embeddings_int8.npy'
+        meta_file = Path(emb_dir) / 'cv_embeddings_int8.json'
+        if not codes_file.exists() or not meta_file.exists():
+            return
+
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            codes = np.load(str(codes_file), mmap_mode='r')
+            if codes.shape != self.cv_embeddings.shape:
+                self.logger.log("Indice int8 non allineato agli embeddings: ignorato", "WARNING")
+                return
+
+            self.int8_codes = codes
+            self.int8_scale = np.array(meta["scale"], dtype=np.float32)
+            self.int8_rerank_factor = meta.get("rerank_factor", 10)
+            self.logger.log(f"Indice int8 caricato: {codes.nbytes / 1e6:.1f} MB, "
+                            f"recall stimata {meta.get('recall_report', {}).get('recall_int8_rerank', 'n/d')}")
+        except Exception as e:
+            self.logger.log(f"Errore caricamento indice int8: {e}", "ERROR")
+
+    def load_metadata(self, emb_dir):
+        """Carica il sidecar cv_metadata.npz (colonne + bitmap Office/Level)"""
+        self.metadata = None
+        metadata_file = Path(emb_dir) / 'cv_metadata.npz'
+        if not metadata_file.exists():
+            self.logger.log("cv_metadata.npz assente: filtri Office/Level disattivati", "WARNING")
+            return
+
+        try:
+            with np.load(str(metadata_file)) as data:
+                metadata = {key: data[key] for key in data.files}
+            if len(metadata["office"]) != len(self.cv_embeddings):
+                self.logger.log("Metadati non allineati agli embeddings: filtri disattivati", "WARNING")
+                return
+            self.metadata = metadata
+            self.logger.log(f"Metadati caricati: {len(metadata['office_values'])} sedi, "
+                            f"{len(metadata['level_values'])} livelli")
+        except Exception as e:
+            self.logger.log(f"Errore caricamento metadati: {e}", "ERROR")
+
+    def build_filter_mask(self, query_json):
+        """
+        Maschera booleana dei CV compatibili con i tag Office:/Level: della query.
+
+        Più valori separati da virgola sono in OR, colonne diverse in AND.
+        Valori vuoti o segnaposto ('...') non filtrano.
+        Ritorna (mask, descrizione) oppure (None, None) se non ci sono filtri.
+        """
+        if self.metadata is None:
+            return None, None
+
+        num_cvs = len(self.cv_embeddings)
+        mask = None
+        description = []
+
+        for column in ["office", "level"]:
+            raw_value = query_json.get(column, "")
+            wanted = {" ".join(v.split()).casefold() for v in re.split(r'[,;|]', raw_value or "")
+                      if not is_placeholder_value(v)}
+            if not wanted:
+                continue
+
+            values = list(self.metadata[f"{column}_values"])
+            column_bits = np.zeros(self.metadata[f"{column}_bitmaps"].shape[1], dtype=np.uint8)
+            for value in wanted:
+                if value in values:
+                    column_bits |= self.metadata[f"{column}_bitmaps"][values.index(value)]
+            column_mask = np.unpackbits(column_bits, count=num_cvs).astype(bool)
+
+            mask = column_mask if mask is None else (mask & column_mask)
+            description.append(f"{column}={raw_value}")
+
+        if mask is None:
+            return None, None
+        return mask, ", ".join(description)
+
+    def search_candidates(self, query_embedding, k, mask=None):
+        """
+        Ritorna (indici, similarità) dei k CV più simili, in ordine decrescente.
+
+        Con mask (filtri Office/Level) il punteggio viene calcolato solo sulle
+        righe ammesse. Con l'indice ANN i candidati arrivano da HNSW, con
+        l'indice int8 da una scansione dei codici compressi; in entrambi i
+        casi vengono ri-valutati con il prodotto scalare esatto. Altrimenti
+        ricerca esatta su tutti i CV.
+        """
+        query_vector = query_embedding[0]
+
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if self.int8_codes is not None and len(rows) > k * self.int8_rerank_factor:
+                approx_scores = score_int8(self.int8_codes[rows], self.int8_scale, query_vector)
+                rows = np.sort(rows[top_k_indices(approx_scores, max(k * self.int8_rerank_factor, 100))])
+            scores = score_dense(self.cv_embeddings, query_vector, rows=rows)
+            top = top_k_indices(scores, k)
+            return rows[top], scores[top]
+
+        if self.ann_index is not None:
+            k = min(k, len(self.cv_embeddings))
+            self.ann_index.set_ef(max(self.ann_ef_search, k))
+            labels, _ = self.ann_index.knn_query(query_vector, k=k)
+            candidates = labels[0].astype(int)
+            scores = np.asarray(self.cv_embeddings[candidates], dtype=np.float32) @ query_vector
+            order = np.argsort(scores)[::-1]
+            return candidates[order], scores[order]
+
+        if self.int8_codes is not None:
+            approx_scores = score_int8(self.int8_codes, self.int8_scale, query_vector)
+            shortlist_size = max(k * self.int8_rerank_factor, 100)
+            shortlist = np.sort(top_k_indices(approx_scores, shortlist_size))
+            scores = np.asarray(self.cv_embeddings[shortlist], dtype=np.float32) @ query_vector
+            top = top_k_indices(scores, k)
+            return shortlist[top], scores[top]
+
+        # Vettori già normalizzati L2: la similarità coseno è un prodotto matrice-vettore
+        # (a blocchi: con --float16 niente copia float32 dell'intero indice)
+        similarities = score_dense(self.cv_embeddings, query_vector)
+        top = top_k_indices(similarities, k)
+        return top, similarities[top]
+
     def _load_model_background(self):
         """Carica BGE-M3 in background senza bloccare la UI"""
         try:
-            self.model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
-            self.logger.log("Modello BGE-M3 caricato (background)")
+            # Server di embedding già attivo: nessun modello da caricare
+            remote = RemoteBGEM3Model.connect('BAAI/bge-m3')
+            if remote is not None:
+                self.model = remote
+                self.logger.log(f"Modello BGE-M3 dal server di embedding {remote.base_url}")
+            else:
+                # Import qui: FlagEmbedding porta con sé torch (diversi secondi)
+                from FlagEmbedding import BGEM3FlagModel
+                self.model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
+                self.logger.log("Modello BGE-M3 caricato (background)")
 
             # Aggiorna UI dal thread principale
             self.root.after(0, self._on_model_ready)
@@ -1180,9 +2164,20 @@ class CVSearchApp:
         self.logger.log(f"Sistema pronto: {len(self.cv_labels)} CV caricati")
 
     
+    def find_candidate_json(self, row, label, json_folder):
+        """JSON di un candidato trovato dalla ricerca: prima per riga dell'indice, poi per label"""
+        if self.json_index is not None:
+            json_file = self.json_index.path_for_row(row)
+            if json_file is not None:
+                return json_file
+        return self.find_existing_json(label, json_folder)
+
     def find_existing_json(self, label, json_folder):
         """Cerca un JSON esistente"""
         json_folder = Path(json_folder)
+        if self.json_index is not None and json_folder == self.json_index.json_folder:
+            return self.json_index.find(label)
+
         if not json_folder.exists():
             return None
         
@@ -1199,8 +2194,29 @@ class CVSearchApp:
         
         return None
     
-    def analyze_cv_with_llm(self, cv_data, query, similarity_score):
-        """Analizza CV usando Ollama LLM locale"""
+    def analyze_cv_with_llm(self, cv_data, query, similarity_score, on_token=None, cancel_event=None):
+        """
+        Analizza CV usando Ollama LLM locale.
+
+        Senza on_token la risposta è richiesta in formato JSON
+        (LLM_EVALUATION_SCHEMA). Con on_token viene richiesta a testo libero
+        in streaming (NDJSON) e ogni frammento viene passato a on_token appena
+        arriva; cancel_event (threading.Event) interrompe la generazione in
+        corso. Ritorna una LLMEvaluation.
+        """
+        import requests
+        if cancel_event is not None and cancel_event.is_set():
+            return LLMEvaluation("⏹ Analisi interrotta")
+
+        # Candidato già valutato con lo stesso modello e la stessa query
+        cached = self.llm_cache.get(self.selected_llm_model, query, cv_data)
+        if cached is not None:
+            self.logger.log(f"Valutazione LLM da cache: {cv_data.get('name', 'N/A')}")
+            evaluation = LLMEvaluation.from_response(cached)
+            if on_token is not None:
+                on_token(evaluation.text)
+            return evaluation
+
         try:
             prompt = f"""Analizza questo CV per la gara.
 
@@ -1222,47 +2238,354 @@ Fornisci (max 200 parole):
 Rispondi in italiano, formato chiaro."""
 
             # Timeout aumentato per primo caricamento modello
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    "model": self.selected_llm_model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
+            response = self.ollama.generate(
+                self.selected_llm_model,
+                prompt,
+                options={
                     "temperature": 0.7,
                     "num_predict": 512,      # ← AUMENTATO (era 200)
                     "num_ctx": 2048,         # ← Contesto più grande
                     "stop": ["---", "###"]   # ← Stop solo su delimitatori specifici
-                }
                 },
-                timeout=180  # ← AUMENTATO A 3 MINUTI
+                stream=on_token is not None,
+                timeout=180,  # ← AUMENTATO A 3 MINUTI
+                format=None if on_token is not None else LLM_EVALUATION_SCHEMA
             )
             
-            if response.status_code == 200:
-                return response.json()['response']
+            if response.status_code != 200:
+                return LLMEvaluation(f"⚠️ Errore LLM: status {response.status_code}")
+
+            if on_token is None:
+                analysis = response.json()['response']
+                if analysis.strip():
+                    self.llm_cache.put(self.selected_llm_model, query, cv_data, analysis)
+                return LLMEvaluation.from_response(analysis)
+
+            # Streaming: una riga JSON per frammento, l'ultima con "done": true
+            parts = []
+            done = False
+            with response:
+                for line in response.iter_lines():
+                    if cancel_event is not None and cancel_event.is_set():
+                        on_token(" [⏹ interrotto]")
+                        return LLMEvaluation("".join(parts) + " [⏹ interrotto]")
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("response", "")
+                    if token:
+                        parts.append(token)
+                        on_token(token)
+                    if chunk.get("done"):
+                        done = True
+                        break
+            analysis = "".join(parts)
+            # In cache solo risposte complete e non vuote (stream troncato → si rivaluta)
+            if done and analysis.strip():
+                self.llm_cache.put(self.selected_llm_model, query, cv_data, analysis)
             else:
-                return f"⚠️ Errore LLM: status {response.status_code}"
+                self.logger.log(f"Risposta LLM incompleta per {cv_data.get('name', 'N/A')}: "
+                                f"non salvata in cache", "WARNING")
+            return LLMEvaluation.from_response(analysis)
                 
         except requests.exceptions.ConnectionError:
-            return "⚠️ Ollama non disponibile. Verifica che sia in esecuzione."
+            return LLMEvaluation("⚠️ Ollama non disponibile. Verifica che sia in esecuzione.")
         except requests.exceptions.Timeout:
-            return "⚠️ Timeout LLM: il modello sta caricando, riprova tra 1 minuto."
+            return LLMEvaluation("⚠️ Timeout LLM: il modello sta caricando, riprova tra 1 minuto.")
         except Exception as e:
-            return f"⚠️ Errore analisi LLM: {str(e)[:100]}"
+            return LLMEvaluation(f"⚠️ Errore analisi LLM: {str(e)[:100]}")
+
+    def analyze_cv_batch_with_llm(self, group, query, cancel_event=None):
+        """
+        Valuta più candidati con un solo prompt e risposta JSON strutturata.
+
+        group: lista di (rank, label, cv_data, similarità). La query viene
+        inviata una sola volta; Ollama risponde secondo LLM_BATCH_SCHEMA
+        (score, strengths, gaps, verdict per candidato) e la risposta viene
+        riconvertita in analisi per candidato. I candidati in cache non
+        vengono inviati; quelli assenti dalla risposta vengono valutati
+        singolarmente. Ritorna {rank: LLMEvaluation}.
+        """
+        results = {}
+        to_send = []
+        for rank, label, cv_data, score in group:
+            cached = self.llm_cache.get(self.selected_llm_model, query, cv_data)
+            if cached is not None:
+                results[rank] = LLMEvaluation.from_response(cached)
+            else:
+                to_send.append((rank, label, cv_data, score))
+
+        if not to_send or (cancel_event is not None and cancel_event.is_set()):
+            for rank, _, _, _ in to_send:
+                results[rank] = LLMEvaluation("⏹ Analisi interrotta")
+            return results
+
+        candidates_text = "\n".join(
+            f"[id={i}] Nome: {cv_data.get('name', 'N/A')}; Ruolo: {cv_data.get('title', 'N/A')}; "
+            f"Skills: {', '.join(cv_data.get('skills', [])[:8])}; "
+            f"Tech: {', '.join(cv_data.get('technologies', [])[:8])}; Score: {score:.2f}"
+            for i, (_, _, cv_data, score) in enumerate(to_send, 1)
+        )
+        prompt = f"""Valuta questi candidati per la gara.
 
-    def plot_pca_3d(self, query_embedding, top_indices, similarities):
-        """Visualizza grafico 3D PCA con query e candidati"""
+GARA: {query[:200]}
+
+CANDIDATI:
+{candidates_text}
+
+Per ogni candidato (usa il suo id) fornisci:
+- score: punteggio 0-100
+- strengths: 2-3 punti di forza
+- gaps: eventuali lacune
+- verdict: IDONEO/DA_VALUTARE/NON_IDONEO
+
+Rispondi in italiano, solo JSON."""
+
+        parsed = {}
         try:
-            # Combina embeddings: query + tutti i CV
-            all_embeddings = np.vstack([query_embedding, self.cv_embeddings])
-            
-            # Applica PCA per ridurre a 3 dimensioni
-            pca = PCA(n_components=3)
-            embeddings_3d = pca.fit_transform(all_embeddings)
-            
-            # Separa query (primo punto) dagli altri
-            query_3d = embeddings_3d[0]
-            cv_embeddings_3d = embeddings_3d[1:]
+            response = self.ollama.generate(
+                self.selected_llm_model,
+                prompt,
+                options={
+                    "temperature": 0.7,
+                    "num_predict": 200 * len(to_send) + 100,
+                    "num_ctx": 4096,
+                },
+                format=LLM_BATCH_SCHEMA,
+                timeout=180
+            )
+            if response.status_code == 200:
+                body = response.json()
+                self.logger.log(
+                    f"LLM batch {len(to_send)} candidati: "
+                    f"{body.get('prompt_eval_count', 0)} token prompt, "
+                    f"{body.get('eval_count', 0)} token risposta "
+                    f"({(body.get('prompt_eval_count', 0) + body.get('eval_count', 0)) / len(to_send):.0f} "
+                    f"token/candidato)")
+                for item in json.loads(body['response']).get("candidates", []):
+                    parsed[int(item.get("id", 0))] = item
+            else:
+                self.logger.log(f"LLM batch: status {response.status_code}", "WARNING")
+        except Exception as e:
+            self.logger.log(f"LLM batch non riuscito, fallback singolo: {e}", "WARNING")
+
+        for i, (rank, _, cv_data, score) in enumerate(to_send, 1):
+            if i in parsed:
+                # In cache la stessa forma della risposta a candidato singolo
+                analysis = json.dumps({key: value for key, value in parsed[i].items() if key != "id"},
+                                      ensure_ascii=False)
+                self.llm_cache.put(self.selected_llm_model, query, cv_data, analysis)
+                results[rank] = LLMEvaluation.from_response(analysis)
+            else:
+                results[rank] = self.analyze_cv_with_llm(cv_data, query, score,
+                                                         cancel_event=cancel_event)
+        return results
+
+    def analyze_candidates_concurrently(self, jobs, query, stream=False, cancel_event=None,
+                                        batch_size=1, on_progress=None):
+        """
+        Esegue analyze_cv_with_llm per più candidati con un pool limitato.
+
+        jobs: lista di (rank, label, cv_data, similarità). Il numero di
+        richieste contemporanee è self.llm_max_workers (di default
+        OLLAMA_NUM_PARALLEL), così Ollama non accoda più di quanto può
+        servire. Senza streaming ogni analisi compare nel pannello appena
+        termina; con streaming ogni candidato ha il suo blocco, riempito
+        token per token. Con batch_size > 1 i candidati sono raggruppati in
+        prompt multi-candidato (analyze_cv_batch_with_llm, senza streaming).
+        on_progress(completati, totale) viene chiamata dopo ogni risposta.
+        Ritorna {rank: LLMEvaluation}.
+        """
+        if not jobs:
+            return {}
+
+        if batch_size > 1:
+            stream = False
+            groups = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+        else:
+            groups = [[job] for job in jobs]
+
+        workers = max(1, min(self.llm_max_workers, len(groups)))
+        self.logger.log(f"Analisi LLM: {len(jobs)} candidati in {len(groups)} richieste, "
+                        f"{workers} parallele, streaming={'sì' if stream else 'no'}")
+        start = time.perf_counter()
+
+        # I worker non toccano la UI: blocchi e frammenti passano dalla coda
+        # del job runner, svuotata dal thread Tk
+        if stream:
+            for rank, label, _, _ in jobs:
+                self.job_runner.post(self._open_llm_block, rank, label)
+
+        def run_group(group):
+            if batch_size > 1:
+                return self.analyze_cv_batch_with_llm(group, query, cancel_event=cancel_event)
+            rank, _, cv_data, score = group[0]
+            on_token = (lambda token: self.job_runner.post(self._insert_llm_token, rank, token)) if stream else None
+            return {rank: self.analyze_cv_with_llm(cv_data, query, score,
+                                                   on_token=on_token, cancel_event=cancel_event)}
+
+        labels = {rank: label for rank, label, _, _ in jobs}
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(run_group, group) for group in groups}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for rank, analysis in sorted(future.result().items()):
+                        results[rank] = analysis
+                        if not stream:
+                            self.append_result(f"\n[{rank}] {labels[rank]}:\n{analysis.text}\n")
+                            self.append_result("─"*40 + "\n")
+                        self.logger.log(f"Analisi LLM completata per: {labels[rank]}")
+                if on_progress is not None:
+                    on_progress(len(results), len(jobs))
+
+        self.logger.log(f"Analisi LLM completate in {time.perf_counter() - start:.1f} s")
+        return results
+
+    def generate_cvs(self, template_path, tasks, on_result=None):
+        """
+        Genera più CV in parallelo con un pool di processi.
+
+        tasks: lista di (json_path, output_path, data), con data il JSON già
+        caricato o None. Ogni CV è generato da
+        generate_cv_job in un processo del pool (self.pptx_max_workers), così
+        parsing del template, sostituzioni e compressione dello zip usano
+        tutti i core. Con meno di self.pptx_process_threshold CV si genera
+        nel processo corrente. on_result(completati, output_path, successo,
+        errore) viene chiamata a ogni CV terminato; cancel_event annulla i
+        CV non ancora avviati. Ritorna [(output_path, successo, errore)].
+        """
+        start = time.perf_counter()
+        results = []
+
+        if len(tasks) < self.pptx_process_threshold:
+            generator = create_generator_for_template(Path(template_path), self.logger)
+            for json_path, output_path, data in tasks:
+                if self.cancel_event.is_set():
+                    break
+                success = generator.generate_cv(json_path, output_path, data=data)
+                results.append((Path(output_path), success, None if success else "Errore nella generazione"))
+                if on_result is not None:
+                    on_result(len(results), *results[-1])
+        else:
+            if self.pptx_log_queue is None:
+                self.pptx_log_queue = self.logger.start_queue_listener(self.pptx_mp_context)
+            if self.pptx_pool is None:
+                self.pptx_pool = ProcessPoolExecutor(max_workers=self.pptx_max_workers,
+                                                     mp_context=self.pptx_mp_context,
+                                                     initializer=_init_generation_worker,
+                                                     initargs=(self.pptx_log_queue,))
+            futures = [self.pptx_pool.submit(generate_cv_job, str(template_path), str(json_path),
+                                             str(output_path), data)
+                       for json_path, output_path, data in tasks]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                try:
+                    output_path, success, error = future.result()
+                except Exception as e:
+                    # Processo worker terminato in modo anomalo: il pool va ricreato
+                    self.logger.log(f"Errore pool generazione PPTX: {e}", "ERROR")
+                    self.pptx_pool = None
+                    output_path = str(tasks[futures.index(future)][1])
+                    success, error = False, str(e)
+                results.append((Path(output_path), success, error))
+                if not success:
+                    self.logger.log(f"Generazione fallita {Path(output_path).name}: {error}", "ERROR")
+                if on_result is not None:
+                    on_result(len(results), *results[-1])
+                if self.cancel_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+
+        self.logger.log(f"Generati {sum(1 for _, success, _ in results if success)}/{len(tasks)} CV "
+                        f"in {time.perf_counter() - start:.1f} s")
+        return results
+
+    def _open_llm_block(self, rank, label):
+        """Crea nel pannello risultati il blocco (mark llm_<rank>) di un candidato in streaming"""
+        # Il mark resta prima del separatore (gravità sinistra), poi
+        # avanza con il testo inserito (gravità destra)
+        self._insert_result(f"\n[{rank}] {label}:\n")
+        self.results_text.mark_set(f"llm_{rank}", "end-1c")
+        self.results_text.mark_gravity(f"llm_{rank}", "left")
+        self._insert_result("\n" + "─"*40 + "\n")
+        self.results_text.mark_gravity(f"llm_{rank}", "right")
+
+    def _insert_llm_token(self, rank, token):
+        """Inserisce un frammento LLM nel blocco del candidato"""
+        self.results_text.configure(state="normal")
+        self.results_text.insert(f"llm_{rank}", token)
+        self.results_text.see("end")
+        self.results_text.configure(state="disabled")
+
+    def rerank_candidates(self, top_candidates, similarities, evaluations):
+        """
+        Riordina i candidati combinando similarità coseno e punteggio LLM.
+
+        evaluations: {rank: LLMEvaluation}, con rank = posizione (da 1) in
+        top_candidates. Punteggio finale = (1 - w) * similarità + w * score/100
+        con w = self.llm_rerank_weight. I candidati senza punteggio LLM
+        (risposta non interpretabile, timeout o analisi interrotta) hanno
+        come punteggio la sola similarità, su una scala diversa: vengono
+        quindi messi dopo tutti i candidati valutati, in ordine di
+        similarità. Ritorna la lista di
+        (indice CV, punteggio combinato, LLMEvaluation o None) ordinata.
+        """
+        w = self.llm_rerank_weight
+        scored, unscored = [], []
+        for rank, idx in enumerate(top_candidates, 1):
+            evaluation = evaluations.get(rank)
+            sim = float(similarities[idx])
+            if evaluation is not None and evaluation.score is not None:
+                scored.append((idx, (1 - w) * sim + w * evaluation.score / 100, evaluation))
+            else:
+                unscored.append((idx, sim, evaluation))
+                self.logger.log(f"Nessun punteggio LLM per {self.cv_labels[idx]}: "
+                                f"in coda alla classifica", "WARNING")
+        scored.sort(key=lambda item: item[1], reverse=True)
+        unscored.sort(key=lambda item: item[1], reverse=True)
+        return scored + unscored
+
+    def compute_pca_3d(self, query_embedding, sample_size=5000, chunk_rows=16384):
+        """
+        Proiezione PCA 3D di query e CV, eseguita nel thread del job.
+
+        La PCA viene stimata sulla query e su al massimo sample_size CV
+        (tutti, sotto la soglia); la proiezione dei CV avviene a blocchi di
+        chunk_rows righe, così l'indice memory-mapped non viene copiato per
+        intero in RAM. Ritorna (query_3d, cv_embeddings_3d, varianza spiegata).
+        """
+        from sklearn.decomposition import PCA
+
+        num_cvs = len(self.cv_embeddings)
+        if num_cvs > sample_size:
+            sample_rows = np.sort(np.random.default_rng(0).choice(num_cvs, sample_size, replace=False))
+            sample = np.asarray(self.cv_embeddings[sample_rows], dtype=np.float32)
+        else:
+            sample = np.asarray(self.cv_embeddings, dtype=np.float32)
+
+        pca = PCA(n_components=3)
+        pca.fit(np.vstack([np.asarray(query_embedding, dtype=np.float32), sample]))
+
+        query_3d = pca.transform(np.asarray(query_embedding, dtype=np.float32))[0]
+        cv_embeddings_3d = np.empty((num_cvs, 3), dtype=np.float32)
+        for start in range(0, num_cvs, chunk_rows):
+            chunk = np.asarray(self.cv_embeddings[start:start + chunk_rows], dtype=np.float32)
+            cv_embeddings_3d[start:start + chunk_rows] = pca.transform(chunk)
+        return query_3d, cv_embeddings_3d, pca.explained_variance_ratio_
+
+    def plot_pca_3d(self, query_3d, cv_embeddings_3d, explained_variance, top_indices, top_similarities):
+        """
+        Visualizza grafico 3D PCA con query e candidati (thread Tk).
+
+        Riceve le coordinate già calcolate da compute_pca_3d; la finestra
+        del grafico non è bloccante, la UI continua ad aggiornarsi.
+        """
+        try:
+            import matplotlib.pyplot as plt
+            from mpl_toolkits.mplot3d import Axes3D  # registra la proiezione '3d'
             
             # Crea figura
             fig = plt.figure(figsize=(12, 9))
@@ -1282,7 +2605,6 @@ Rispondi in italiano, formato chiaro."""
             
             # Plot top candidati (colorati per similarità)
             top_embeddings_3d = cv_embeddings_3d[top_indices]
-            top_similarities = similarities[top_indices]
             
             scatter = ax.scatter(top_embeddings_3d[:, 0],
                                 top_embeddings_3d[:, 1],
@@ -1323,11 +2645,11 @@ Rispondi in italiano, formato chiaro."""
                    color='red')
             
             # Configura assi
-            ax.set_xlabel(f'PC1 ({pca.explained_variance_ratio_[0]*100:.1f}%)', fontsize=10)
-            ax.set_ylabel(f'PC2 ({pca.explained_variance_ratio_[1]*100:.1f}%)', fontsize=10)
-            ax.set_zlabel(f'PC3 ({pca.explained_variance_ratio_[2]*100:.1f}%)', fontsize=10)
+            ax.set_xlabel(f'PC1 ({explained_variance[0]*100:.1f}%)', fontsize=10)
+            ax.set_ylabel(f'PC2 ({explained_variance[1]*100:.1f}%)', fontsize=10)
+            ax.set_zlabel(f'PC3 ({explained_variance[2]*100:.1f}%)', fontsize=10)
             ax.set_title('Visualizzazione 3D PCA: Query e Candidati\nVarianza spiegata: {:.1f}%'.format(
-                sum(pca.explained_variance_ratio_) * 100), fontsize=14, fontweight='bold')
+                sum(explained_variance) * 100), fontsize=14, fontweight='bold')
             
             # Colorbar
             cbar = plt.colorbar(scatter, ax=ax, pad=0.1, shrink=0.8)
@@ -1340,7 +2662,7 @@ Rispondi in italiano, formato chiaro."""
             ax.grid(True, alpha=0.3)
             
             plt.tight_layout()
-            plt.show()
+            plt.show(block=False)
             
             self.logger.log("Grafico PCA 3D generato con successo")
             
@@ -1462,7 +2784,7 @@ Rispondi in italiano, formato chiaro."""
             self.direct_gen_button.configure(state="normal", text="⚡ Genera CV Diretto")
 
     def run_full_pipeline(self):
-        """Esegue la pipeline completa"""
+        """Avvia la pipeline completa in background"""
         if self.model is None:
             messagebox.showwarning("Attenzione", "Modello non caricato")
             return
@@ -1471,13 +2793,46 @@ Rispondi in italiano, formato chiaro."""
         if not query:
             messagebox.showwarning("Attenzione", "Inserisci una query!")
             return
-        
+
+        if self.job_runner.is_running():
+            return
+
+        # Disabilita bottone durante elaborazione
+        self.search_button.configure(state="disabled", text="⏳ Elaborazione...")
+        self.cancel_button.configure(state="normal")
+        self.progress_bar.set(0)
+
+        # Le variabili Tk si leggono qui, nel thread della UI
+        self.job_runner.start(
+            self._run_pipeline_job,
+            query,
+            int(self.num_candidates.get()),
+            self.llm_stream_var.get(),
+            self.llm_batch_size if self.llm_batch_var.get() else 1
+        )
+
+    def _on_pipeline_finished(self):
+        """Ripristina i comandi al termine della pipeline (thread UI)"""
+        self.search_button.configure(state="normal", text="🔎 Avvia Ricerca e Genera CV")
+        self.cancel_button.configure(state="disabled")
+
+    def _pipeline_cancelled(self):
+        """True (e messaggio a video) se l'utente ha interrotto la pipeline"""
+        if not self.cancel_event.is_set():
+            return False
+        self.append_result("\n⏹ Pipeline interrotta dall'utente\n")
+        self.set_status("⏹ Pipeline interrotta")
+        self.logger.log("=== PIPELINE INTERROTTA ===")
+        return True
+
+    def _run_pipeline_job(self, query, num_candidates, stream, batch_size):
+        """
+        Corpo della pipeline, eseguito nel thread del BackgroundJobRunner.
+
+        Tutti gli aggiornamenti della UI passano da append_result,
+        set_status e job_runner.post.
+        """
         try:
-            # Disabilita bottone durante elaborazione
-            self.search_button.configure(state="disabled", text="⏳ Elaborazione...")
-            self.root.update()
-            
-            num_candidates = int(self.num_candidates.get())
             self.logger.log(f"=== INIZIO PIPELINE ===")
             self.logger.log(f"Query: {query[:100]}...")
             self.logger.log(f"Numero candidati: {num_candidates}")
@@ -1489,12 +2844,17 @@ Rispondi in italiano, formato chiaro."""
             self.append_result(f"Candidati richiesti: {num_candidates}\n\n")
             
             # STEP 1
-            self.status_label.configure(text="⏳ Step 1/3: Calcolo similarità...", text_color="orange")
-            self.root.update()
+            self.set_status("⏳ Step 1/3: Calcolo similarità...", progress=0.05)
             
             # Usa lo stesso processo pesato di create_embeddings_weighted.py
+            search_start = time.perf_counter()
             query_embedding, query_json, query_sections = self.build_query_embedding(query)
-            similarities = cosine_similarity(query_embedding, self.cv_embeddings)[0]
+            filter_mask, filter_description = self.build_filter_mask(query_json)
+            top_candidates, top_scores = self.search_candidates(
+                query_embedding, num_candidates, mask=filter_mask)
+            similarities = dict(zip(top_candidates, top_scores))  # indice CV → similarità
+            self.logger.log(f"Latenza ricerca (embedding + similarità): "
+                            f"{(time.perf_counter() - search_start) * 1000:.0f} ms")
             
             # Mostra nei risultati le sezioni pesate
             self.append_result("🔄 QUERY NORMALIZZATA (Weighted Sections):\n")
@@ -1503,13 +2863,22 @@ Rispondi in italiano, formato chiaro."""
             for section, text in query_sections.items():
                 self.append_result(f"  [{weights_display[section]}] {section}: {text[:100]}\n")
                 self.append_result("\n")
-            sorted_indices = np.argsort(similarities)[::-1]
-            top_candidates = sorted_indices[:num_candidates]
+            
+            if filter_mask is not None:
+                self.append_result(f"🔍 Filtri: {filter_description} → "
+                                   f"{int(filter_mask.sum())}/{len(filter_mask)} CV ammessi\n\n")
+                self.logger.log(f"Filtri {filter_description}: {int(filter_mask.sum())} CV ammessi")
+            
+            if len(top_candidates) == 0:
+                self.append_result("⚠️ Nessun CV corrisponde ai filtri Office/Level\n")
+                self.set_status("⚠️ Nessun candidato con questi filtri", progress=0)
+                return
             
             self.append_result("📊 STEP 1: CANDIDATI SELEZIONATI\n")
             self.append_result("─"*80 + "\n")
             
             selected_labels = []
+            selected_rows = list(top_candidates)
             for rank, idx in enumerate(top_candidates, 1):
                 label = self.cv_labels[idx]
                 sim = similarities[idx]
@@ -1520,37 +2889,62 @@ Rispondi in italiano, formato chiaro."""
             # ANALISI LLM PER OGNI CANDIDATO
             self.append_result("\n🤖 ANALISI LLM DEI CANDIDATI\n")
             self.append_result("─"*80 + "\n")
-            self.status_label.configure(text="⏳ Analisi LLM in corso...", text_color="orange")
+            self.set_status("⏳ Analisi LLM in corso...", progress=0.1)
 
             extractor_temp = PPTXToJSONExtractor(logger=self.logger)
 
+            llm_jobs = []
+            json_by_row = {}  # riga → JSON, riusato nello Step 2
             for rank, (idx, label) in enumerate(zip(top_candidates, selected_labels), 1):
                 # Carica JSON del candidato
-                json_file = self.find_existing_json(label, extractor_temp.cv_json_folder)
+                json_file = self.find_candidate_json(idx, label, extractor_temp.cv_json_folder)
                 
                 if json_file and json_file.exists():
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        cv_data = json.load(f)
-                    
-                    # Analisi LLM
-                    self.append_result(f"\n[{rank}] {label}:\n")
-                    self.root.update()
-                    
-                    analysis = self.analyze_cv_with_llm(cv_data, query, similarities[idx])
-                    self.append_result(f"{analysis}\n")
-                    self.append_result("─"*40 + "\n")
-                    self.logger.log(f"Analisi LLM completata per: {label}")
+                    json_by_row[idx] = json_file
+                    cv_data = self.documents.get(json_file)
+                    llm_jobs.append((rank, label, cv_data, similarities[idx]))
                 else:
                     self.append_result(f"\n[{rank}] {label}: ⚠️ JSON non disponibile per analisi\n")
 
+            # Analisi LLM in parallelo: i risultati compaiono man mano che arrivano
+            evaluations = self.analyze_candidates_concurrently(
+                llm_jobs, query,
+                stream=stream,
+                cancel_event=self.cancel_event,
+                batch_size=batch_size,
+                on_progress=lambda done, total: self.set_status(
+                    f"⏳ Analisi LLM {done}/{total}...", progress=0.1 + 0.5 * done / total)
+            )
+
+            if self._pipeline_cancelled():
+                return
+
+            # RE-RANKING: similarità + punteggio LLM
+            if any(evaluation.score is not None for evaluation in evaluations.values()):
+                ranked = self.rerank_candidates(top_candidates, similarities, evaluations)
+                self.append_result(f"\n🏆 CLASSIFICA FINALE (similarità {1 - self.llm_rerank_weight:.0%} "
+                                   f"+ LLM {self.llm_rerank_weight:.0%})\n")
+                self.append_result("─"*80 + "\n")
+                for rank, (idx, combined, evaluation) in enumerate(ranked, 1):
+                    llm_score = evaluation.score if evaluation is not None and evaluation.score is not None else "N/A"
+                    verdict = evaluation.verdict if evaluation is not None and evaluation.verdict else "N/A"
+                    self.append_result(f"  {rank}. {self.cv_labels[idx]}\n     Punteggio: {combined:.4f} "
+                                       f"(sim={similarities[idx]:.4f}, LLM={llm_score}, esito={verdict})\n\n")
+                    self.logger.log(f"Re-ranking {rank}: {self.cv_labels[idx]} (punteggio={combined:.4f})")
+                selected_labels = [self.cv_labels[idx] for idx, _, _ in ranked]
+                selected_rows = [idx for idx, _, _ in ranked]
+
             # Visualizza grafico 3D PCA (FUORI DAL LOOP)
             self.append_result("\n📈 Generazione grafico PCA 3D...\n")
-            self.root.update()
-            self.plot_pca_3d(query_embedding, top_candidates, similarities)
+            try:
+                pca_points = self.compute_pca_3d(query_embedding)
+                self.job_runner.post(self.plot_pca_3d, *pca_points, top_candidates, top_scores)
+            except Exception as e:
+                self.logger.log(f"Errore calcolo PCA: {e}", "ERROR")
+                self.append_result(f"⚠️ Grafico PCA non disponibile: {e}\n")
             
             # STEP 2
-            self.status_label.configure(text="⏳ Step 2/3: Verifica JSON...", text_color="orange")
-            self.root.update()
+            self.set_status("⏳ Step 2/3: Verifica JSON...", progress=0.6)
             
             self.append_result("\n📁 STEP 2: VERIFICA JSON\n")
             self.append_result("─"*80 + "\n")
@@ -1558,11 +2952,13 @@ Rispondi in italiano, formato chiaro."""
             extractor = PPTXToJSONExtractor(logger=self.logger)
             json_files = []
             
-            for i, label in enumerate(selected_labels, 1):
+            for i, (idx, label) in enumerate(zip(selected_rows, selected_labels), 1):
+                if self._pipeline_cancelled():
+                    return
                 self.append_result(f"[{i}/{len(selected_labels)}] {label}...\n")
-                self.root.update()
                 
-                existing_json = self.find_existing_json(label, extractor.cv_json_folder)
+                existing_json = json_by_row.get(idx) or self.find_candidate_json(
+                    idx, label, extractor.cv_json_folder)
                 
                 if existing_json and existing_json.exists():
                     json_files.append(existing_json)
@@ -1573,43 +2969,49 @@ Rispondi in italiano, formato chiaro."""
                     
                     if json_file and json_file.exists():
                         json_files.append(json_file)
+                        if self.json_index is not None:
+                            self.json_index.add(json_file)
                         self.append_result(f"  ✅ JSON creato: {json_file.name}\n\n")
                     else:
                         self.append_result(f"  ❌ ERRORE: PPTX non trovato\n\n")
             
             # STEP 3
-            self.status_label.configure(text="⏳ Step 3/3: Generazione CV...", text_color="orange")
-            self.root.update()
+            self.set_status("⏳ Step 3/3: Generazione CV...", progress=0.7)
             
             self.append_result("\n📄 STEP 3: GENERAZIONE CV\n")
             self.append_result("─"*80 + "\n")
             
             # Verifica che sia stato selezionato un template
             if not self.selected_template:
-                messagebox.showerror("Errore", "Nessun template selezionato!")
-                self.search_button.configure(state="normal", text="🔎 Avvia Ricerca e Genera CV")
+                self.job_runner.post(messagebox.showerror, "Errore", "Nessun template selezionato!")
                 return
 
             output_folder = BASE_DIR / "output"
             output_folder.mkdir(exist_ok=True)
             
-            generated_files = []
-            for i, json_file in enumerate(json_files, 1):
+            generation_tasks = []
+            for json_file in json_files:
                 json_stem = json_file.stem
                 if json_stem.lower().startswith("cv_"):
                     json_stem = json_stem[3:]
-                
-                output_file = output_folder / f"CV_{json_stem}.pptx"
-                self.append_result(f"[{i}/{len(json_files)}] {json_stem}...\n")
-                
-                # Crea il generator per il template selezionato
-                generator = create_generator_for_template(self.selected_template['path'], self.logger)
+                generation_tasks.append((json_file, output_folder / f"CV_{json_stem}.pptx",
+                                         self.documents.get(json_file)))
 
-                if generator.generate_cv(json_file, output_file):
-                    generated_files.append(output_file)
-                    self.append_result(f"  ✅ CV generato: {output_file.name}\n\n")
+            def on_generated(done, output_file, success, error):
+                if success:
+                    self.append_result(f"[{done}/{len(generation_tasks)}] ✅ CV generato: {output_file.name}\n\n")
                 else:
-                    self.append_result(f"  ❌ Errore nella generazione\n\n")
+                    self.append_result(f"[{done}/{len(generation_tasks)}] ❌ {output_file.name}: {error}\n\n")
+                self.set_status(f"⏳ Step 3/3: Generazione CV {done}/{len(generation_tasks)}...",
+                                progress=0.7 + 0.3 * done / len(generation_tasks))
+
+            generation_results = self.generate_cvs(self.selected_template['path'], generation_tasks,
+                                                   on_result=on_generated)
+            if self._pipeline_cancelled():
+                return
+            generated_files = [output_file for output_file, success, _ in generation_results if success]
+            self.logger.log(f"Documenti JSON: {self.documents.misses} letture da disco, "
+                            f"{self.documents.hits} dalla cache (sessione)")
             
             # RIEPILOGO
             self.append_result("\n" + "═"*80 + "\n")
@@ -1621,14 +3023,11 @@ Rispondi in italiano, formato chiaro."""
             self.append_result(f"📁 Cartella output: {output_folder}\n")
             self.append_result("═"*80 + "\n")
             
-            self.status_label.configure(text=f"✅ Pipeline completata! {len(generated_files)} CV generati", 
-                                       text_color="#2CC985")
+            self.set_status(f"✅ Pipeline completata! {len(generated_files)} CV generati",
+                            color="#2CC985", progress=1)
             self.logger.log(f"=== PIPELINE COMPLETATA: {len(generated_files)} CV generati ===")
             
-            # Riabilita bottone
-            self.search_button.configure(state="normal", text="🔎 Cerca e Genera CV")
-            
-            messagebox.showinfo("✅ Successo!", 
+            self.job_runner.post(messagebox.showinfo, "✅ Successo!", 
                 f"Pipeline completata con successo!\n\n"
                 f"CV generati: {len(generated_files)}\n"
                 f"Cartella: {output_folder}\n\n"
@@ -1637,22 +3036,40 @@ Rispondi in italiano, formato chiaro."""
         except Exception as e:
             error_msg = f"Errore nella pipeline: {e}"
             self.append_result(f"\n❌ ERRORE: {error_msg}\n")
-            messagebox.showerror("Errore", error_msg)
-            self.status_label.configure(text="❌ Errore nella pipeline", text_color="red")
+            self.job_runner.post(messagebox.showerror, "Errore", error_msg)
+            self.set_status("❌ Errore nella pipeline", color="red")
             self.logger.log(error_msg, "ERROR")
-            self.search_button.configure(state="normal", text="🔎 Cerca e Genera CV")
+
+        finally:
+            # Riabilita bottone
+            self.job_runner.post(self._on_pipeline_finished)
     
     def append_result(self, text):
-        """Aggiunge testo ai risultati"""
+        """Aggiunge testo ai risultati (da qualsiasi thread: la scrittura avviene nel thread Tk)"""
+        self.job_runner.post(self._insert_result, text)
+
+    def _insert_result(self, text):
         self.results_text.configure(state="normal")
         self.results_text.insert("end", text)
         self.results_text.see("end")
         self.results_text.configure(state="disabled")
-        self.root.update()
+
+    def set_status(self, text, color="orange", progress=None):
+        """Aggiorna barra di stato e avanzamento (0-1) da qualsiasi thread"""
+        self.job_runner.post(self._apply_status, text, color, progress)
+
+    def _apply_status(self, text, color, progress):
+        self.status_label.configure(text=text, text_color=color)
+        if progress is not None:
+            self.progress_bar.set(progress)
     
     def run(self):
         """Avvia l'applicazione"""
         self.root.mainloop()
+        if self.pptx_pool is not None:
+            self.pptx_pool.shutdown(wait=False, cancel_futures=True)
+        if self.pptx_log_queue is not None:
+            self.pptx_log_queue.put(None)
 
 def main():
     app = CVSearchApp()
@@ -1,7 +1,8 @@
 # create_embeddings_weighted.py
-from FlagEmbedding import BGEM3FlagModel
 import numpy as np
 import json
+import sys
+import hashlib
 from pathlib import Path
 from datetime import datetime
 from sklearn.manifold import TSNE
@@ -9,25 +10,50 @@ from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # → codes/ (common.py)
+from common import (LOG_LEVELS, BufferedLogWriter, file_fingerprint, get_cli_option,
+                    RemoteBGEM3Model, SectionEmbeddingCache, score_int8)
+
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent  # → RAG/
+EMB_DIR = BASE_DIR / "input" / "embeddings"
+MODEL_NAME = 'BAAI/bge-m3'
+SECTIONS = ['skills', 'experience', 'education', 'summary']
+MANIFEST_FILE = 'embeddings_manifest.json'
+SECTION_CACHE_FILE = 'section_cache.sqlite'
+ANN_INDEX_FILE = 'cv_index_hnsw.bin'
+ANN_META_FILE = 'cv_index_hnsw.json'
+INT8_CODES_FILE = 'cv_embeddings_int8.npy'
+INT8_META_FILE = 'cv_embeddings_int8.json'
+METADATA_FILE = 'cv_metadata.npz'
+
 
 class EmbeddingLogger:
-    """Gestisce il logging su file con timestamp"""
-    def __init__(self, log_folder=BASE_DIR / "log_executions"):
+    """
+    Gestisce il logging su file con timestamp.
+
+    Scrittura asincrona (BufferedLogWriter). level: soglia minima; con
+    INFO (default) le anteprime per singolo CV (livello DEBUG) vengono
+    saltate. log_error e log_warning scrivono a livello ERROR e WARNING,
+    log_success a INFO: con --log-level=WARNING restano solo avvisi ed errori.
+    """
+    def __init__(self, log_folder=BASE_DIR / "log_executions", level="INFO"):
         self.log_folder = Path(log_folder)
         self.log_folder.mkdir(exist_ok=True, parents=True)
+        self.min_level = LOG_LEVELS.get(level.upper(), 20)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.log_file = self.log_folder / f"{timestamp}_embeddings_creation.txt"
+        self.writer = BufferedLogWriter(self.log_file)
         
         self.log(f"{'='*80}")
         self.log(f"CREAZIONE EMBEDDINGS PESATI - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         self.log(f"{'='*80}\n")
     
-    def log(self, message, also_print=True):
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f"{message}\n")
+    def log(self, message, also_print=True, level="INFO"):
+        if LOG_LEVELS.get(level, 20) < self.min_level:
+            return
+        self.writer.write(message)
         if also_print:
             print(message)
     
@@ -39,15 +65,15 @@ class EmbeddingLogger:
     
     def log_error(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log(f"[{timestamp}] ❌ ERRORE: {message}")
+        self.log(f"[{timestamp}] ❌ ERRORE: {message}", level="ERROR")
     
     def log_success(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log(f"[{timestamp}] ✓ {message}")
+        self.log(f"[{timestamp}] ✓ {message}", level="INFO")
     
     def log_warning(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log(f"[{timestamp}] ⚠ WARNING: {message}")
+        self.log(f"[{timestamp}] ⚠ WARNING: {message}", level="WARNING")
 
 
 def create_visualization_2d(embeddings, labels, output_folder=None, logger=None):
@@ -299,8 +325,15 @@ def json_to_sections(json_data):
     return sections
 
 
+def content_hash(content):
+    """Hash SHA-256 di testo o bytes (usato dal manifest per il rebuild incrementale)"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
 def load_json_files_with_sections(json_folder=None, logger=None):
-    """Carica JSON e crea sezioni separate"""
+    """Carica JSON e crea sezioni separate (con hash del contenuto per file)"""
     json_path = Path(json_folder) if json_folder else BASE_DIR / "input" / "cv_json"
     
     if not json_path.exists():
@@ -325,11 +358,13 @@ def load_json_files_with_sections(json_folder=None, logger=None):
     cv_sections_list = []
     cv_labels = []
     cv_json_names = []
+    cv_file_hashes = []
+    cv_metadata = []
     
     for json_file in sorted(json_files):
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            raw = json_file.read_bytes()
+            data = json.loads(raw.decode('utf-8'))
             
             # Converti in sezioni
             sections = json_to_sections(data)
@@ -339,13 +374,19 @@ def load_json_files_with_sections(json_folder=None, logger=None):
             label = data.get("name", json_file.stem)
             cv_labels.append(label)
             cv_json_names.append(json_file.stem)
+            cv_file_hashes.append(content_hash(raw))
+            cv_metadata.append({
+                "office": str(data.get("Office", "") or data.get("office", "")),
+                "level": str(data.get("Level", "") or data.get("level", "")),
+                "title": str(data.get("title", "") or "")
+            })
             
             if logger:
                 logger.log_success(f"Caricato: {json_file.name}")
-                logger.log(f"    Nome: {label}")
-                logger.log(f"    Skills preview: {sections['skills'][:80]}...")
-                logger.log(f"    Experience preview: {sections['experience'][:80]}...")
-                logger.log("")
+                logger.log(f"    Nome: {label}", level="DEBUG")
+                logger.log(f"    Skills preview: {sections['skills'][:80]}...", level="DEBUG")
+                logger.log(f"    Experience preview: {sections['experience'][:80]}...", level="DEBUG")
+                logger.log("", level="DEBUG")
             
         except Exception as e:
             if logger:
@@ -354,18 +395,191 @@ def load_json_files_with_sections(json_folder=None, logger=None):
     if logger:
         logger.log(f"Totale CV caricati: {len(cv_sections_list)}/{len(json_files)}")
     
-    return cv_sections_list, cv_labels, cv_json_names
+    return cv_sections_list, cv_labels, cv_json_names, cv_file_hashes, cv_metadata
+
+
+def normalize_filter_value(value):
+    """Normalizza un valore di Office/Level per il confronto nei filtri"""
+    return " ".join(str(value).split()).casefold()
+
+
+def save_metadata_sidecar(cv_metadata, emb_dir=None, logger=None):
+    """
+    Salva cv_metadata.npz: colonne Office, Level, title (una riga per CV,
+    allineate a cv_embeddings.npy) e un indice bitmap per Office e Level.
+    
+    Per ogni valore distinto (normalizzato) di una colonna viene salvata una
+    bitmap compressa con np.packbits: bit i = 1 se il CV alla riga i ha quel
+    valore. L'app combina le bitmap per restringere i candidati prima del
+    prodotto scalare.
+    """
+    emb_dir = Path(emb_dir) if emb_dir else EMB_DIR
+    num_cvs = len(cv_metadata)
+    arrays = {}
+    
+    for column in ["office", "level", "title"]:
+        arrays[column] = np.array([meta[column] for meta in cv_metadata], dtype=str)
+    
+    for column in ["office", "level"]:
+        normalized = np.array([normalize_filter_value(v) for v in arrays[column]], dtype=str)
+        values = sorted(set(normalized) - {""})
+        bitmaps = np.zeros((len(values), (num_cvs + 7) // 8), dtype=np.uint8)
+        for i, value in enumerate(values):
+            bitmaps[i] = np.packbits(normalized == value)
+        arrays[f"{column}_values"] = np.array(values, dtype=str)
+        arrays[f"{column}_bitmaps"] = bitmaps
+        if logger:
+            logger.log(f"  - {column}: {len(values)} valori distinti")
+    
+    np.savez(str(emb_dir / METADATA_FILE), **arrays)
+    if logger:
+        logger.log_success(f"{METADATA_FILE} salvato (colonne + bitmap Office/Level)")
+
+
+def load_manifest(emb_dir=None):
+    """Legge il manifest dell'ultima build (None se assente o illeggibile)"""
+    manifest_path = (Path(emb_dir) if emb_dir else EMB_DIR) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def build_manifest(cv_sections_list, cv_json_names, cv_file_hashes, weights):
+    """Crea il manifest: hash del file JSON e di ogni sezione, per riga dell'indice"""
+    files = {}
+    for row, (sections, json_name, file_hash) in enumerate(
+            zip(cv_sections_list, cv_json_names, cv_file_hashes)):
+        files[json_name] = {
+            "row": row,
+            "file_hash": file_hash,
+            "sections": {section: content_hash(sections[section]) for section in SECTIONS}
+        }
+    return {
+        "model": MODEL_NAME,
+        "weights": weights,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "files": files
+    }
+
+
+def load_cached_section_embeddings(cv_sections_list, cv_json_names, cv_file_hashes,
+                                   emb_dir=None, logger=None):
+    """
+    Recupera dalla build precedente gli embeddings delle sezioni invariate.
+    
+    Confronta l'hash di ogni sezione con quello del manifest: le sezioni
+    identiche vengono riusate dai file cv_embeddings_<sezione>.npy, le altre
+    andranno ricalcolate. I file JSON eliminati vengono semplicemente scartati.
+    
+    Returns:
+        cached_by_section: Dict {sezione: {riga_nuova: vettore}}
+    """
+    emb_dir = Path(emb_dir) if emb_dir else EMB_DIR
+    cached_by_section = {section: {} for section in SECTIONS}
+    
+    manifest = load_manifest(emb_dir)
+    if manifest is None or manifest.get("model") != MODEL_NAME:
+        if logger:
+            logger.log("Nessun manifest valido: rebuild completo")
+        return cached_by_section
+    
+    try:
+        previous = {
+            section: np.load(str(emb_dir / f'cv_embeddings_{section}.npy'))
+            for section in SECTIONS
+        }
+    except Exception as e:
+        if logger:
+            logger.log_warning(f"Embeddings per sezione non leggibili ({e}): rebuild completo")
+        return cached_by_section
+    
+    old_files = manifest.get("files", {})
+    unchanged, changed, new = 0, 0, 0
+    
+    for row, (sections, json_name, file_hash) in enumerate(
+            zip(cv_sections_list, cv_json_names, cv_file_hashes)):
+        old_entry = old_files.get(json_name)
+        if old_entry is None:
+            new += 1
+            continue
+        
+        old_row = old_entry.get("row", -1)
+        if not 0 <= old_row < len(previous['skills']):
+            new += 1
+            continue
+        
+        if old_entry.get("file_hash") == file_hash:
+            unchanged += 1
+        else:
+            changed += 1
+        
+        for section in SECTIONS:
+            if old_entry.get("sections", {}).get(section) == content_hash(sections[section]):
+                cached_by_section[section][row] = previous[section][old_row]
+    
+    removed = len(set(old_files) - set(cv_json_names))
+    
+    if logger:
+        logger.log_section("REBUILD INCREMENTALE")
+        logger.log(f"CV invariati: {unchanged}")
+        logger.log(f"CV modificati: {changed}")
+        logger.log(f"CV nuovi: {new}")
+        logger.log(f"CV eliminati: {removed}")
+        for section in SECTIONS:
+            reused = len(cached_by_section[section])
+            logger.log(f"  - {section}: {reused} riusati, {len(cv_sections_list) - reused} da calcolare")
+    
+    return cached_by_section
 
 
-def create_weighted_embeddings(cv_sections_list, model, weights=None, logger=None):
+def encode_texts_length_sorted(texts, model, batch_size=32):
+    """
+    Codifica una lista di testi in un'unica chiamata al modello.
+    
+    I testi vengono ordinati per lunghezza prima dell'encoding, così ogni
+    batch contiene testi di lunghezza simile e il padding è minimo; i
+    vettori vengono poi riportati nell'ordine originale.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    sorted_embeddings = model.encode([texts[i] for i in order], batch_size=batch_size)['dense_vecs']
+    
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+
+def pending_section_texts(cv_sections_list, cached_by_section=None):
+    """Ritorna le tuple (sezione, riga, testo) non coperte da cached_by_section"""
+    cached_by_section = cached_by_section or {}
+    pending = []
+    for section in SECTIONS:
+        cached = cached_by_section.get(section, {})
+        pending.extend(
+            (section, i, sections[section])
+            for i, sections in enumerate(cv_sections_list) if i not in cached
+        )
+    return pending
+
+
+def create_weighted_embeddings(cv_sections_list, model, weights=None, logger=None,
+                               cached_by_section=None, text_cache=None, cached_texts=None):
     """
     Crea embeddings pesati per ogni CV.
     
     Args:
         cv_sections_list: Lista di dizionari con sezioni {skills, experience, education, summary}
-        model: Modello BGE-M3
+        model: Modello BGE-M3 (può essere None se tutte le sezioni sono in cache)
         weights: Dict con pesi per ogni sezione (default: raccomandazioni della guida)
         logger: Logger per output
+        cached_by_section: Dict {sezione: {riga: vettore}} riusati dalla build
+            precedente; vengono codificate solo le righe mancanti
+        text_cache: SectionEmbeddingCache opzionale consultata prima del modello
+        cached_texts: Dict {testo: vettore} già letto da text_cache per i testi
+            da calcolare; se presente la cache non viene interrogata di nuovo
     
     Returns:
         embeddings_final: Array numpy con embeddings pesati finali
@@ -392,21 +606,50 @@ def create_weighted_embeddings(cv_sections_list, model, weights=None, logger=Non
     # Dizionario per salvare embeddings per sezione
     embeddings_by_section = {}
     
-    # Processa ogni sezione
-    for section in ['skills', 'experience', 'education', 'summary']:
+    cached_by_section = cached_by_section or {}
+    
+    # 1. Appiattisce tutte le sezioni da calcolare in un'unica lista
+    pending = pending_section_texts(cv_sections_list, cached_by_section)
+    if logger:
+        for section in SECTIONS:
+            cached = len(cached_by_section.get(section, {}))
+            logger.log(f"Sezione {section.upper()}: "
+                       f"{num_cvs - cached} da calcolare, {cached} in cache")
+    
+    # 2. Cache testo → embedding, poi un solo passaggio sul modello
+    #    con batch ordinati per lunghezza per i testi mai visti
+    new_vectors = {}
+    if pending:
+        unique_texts = list(dict.fromkeys(text for _, _, text in pending))
+        if cached_texts is not None:
+            new_vectors = dict(cached_texts)
+        elif text_cache is not None:
+            new_vectors = text_cache.get_many(unique_texts)
+        to_encode = [text for text in unique_texts if text not in new_vectors]
         if logger:
-            logger.log(f"Generando embeddings per sezione: {section.upper()}")
-        
-        # Estrai testi di questa sezione per tutti i CV
-        section_texts = [cv[section] for cv in cv_sections_list]
-        
-        # Genera embeddings
-        section_embeddings = model.encode(section_texts, batch_size=32)['dense_vecs']
-        
+            logger.log(f"\nEncoding in un unico stream: {len(pending)} sezioni, "
+                       f"{len(unique_texts)} testi unici, {len(to_encode)} da codificare")
+        if to_encode:
+            encoded = encode_texts_length_sorted(to_encode, model, batch_size=32)
+            encoded_by_text = dict(zip(to_encode, encoded))
+            if text_cache is not None:
+                text_cache.put_many(encoded_by_text)
+            new_vectors.update(encoded_by_text)
+    
+    # 3. Ricompone gli array per sezione nell'ordine delle righe correnti
+    embedding_dim = (len(next(iter(new_vectors.values()))) if new_vectors
+                     else len(next(iter(cached_by_section['skills'].values()))))
+    for section in SECTIONS:
+        section_embeddings = np.zeros((num_cvs, embedding_dim), dtype=np.float32)
+        for row, vector in cached_by_section.get(section, {}).items():
+            section_embeddings[row] = vector
         embeddings_by_section[section] = section_embeddings
-        
-        if logger:
-            logger.log(f"  Shape: {section_embeddings.shape}")
+    
+    for section, row, text in pending:
+        embeddings_by_section[section][row] = new_vectors[text]
+    
+    if logger:
+        logger.log(f"  Shape per sezione: {(num_cvs, embedding_dim)}")
     
     # Combina con pesi
     if logger:
@@ -414,20 +657,196 @@ def create_weighted_embeddings(cv_sections_list, model, weights=None, logger=Non
     
     # Inizializza array finale
     embedding_dim = embeddings_by_section['skills'].shape[1]
-    embeddings_final = np.zeros((num_cvs, embedding_dim))
+    embeddings_final = np.zeros((num_cvs, embedding_dim), dtype=np.float32)
     
     # Somma pesata
     for section, weight in weights.items():
         embeddings_final += embeddings_by_section[section] * weight
     
+    # Normalizzazione L2: in ricerca la similarità coseno diventa un semplice prodotto scalare
+    norms = np.linalg.norm(embeddings_final, axis=1, keepdims=True)
+    embeddings_final /= np.maximum(norms, 1e-12)
+    
     if logger:
-        logger.log_success(f"Embeddings finali creati: shape={embeddings_final.shape}")
+        logger.log_success(f"Embeddings finali creati (normalizzati L2): shape={embeddings_final.shape}")
     
     return embeddings_final, embeddings_by_section
 
 
+def exact_top_k(embeddings, queries, k):
+    """Top-k esatto per prodotto scalare (embeddings normalizzati L2)"""
+    scores = queries @ embeddings.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def evaluate_ann_recall(index, embeddings, k=10, ef_values=(16, 32, 64, 128, 256),
+                        num_queries=200, logger=None):
+    """
+    Report recall@k dell'indice ANN rispetto alla ricerca esatta.
+    
+    Usa come query un campione dei CV stessi e misura, per ogni valore di
+    ef, la frazione dei k vicini esatti ritrovati e la latenza media.
+    """
+    k = min(k, len(embeddings))
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+    queries = np.asarray(embeddings[sample], dtype=np.float32)
+    exact = exact_top_k(embeddings, queries, k)
+    
+    report = []
+    for ef in ef_values:
+        index.set_ef(max(ef, k))
+        start = datetime.now()
+        approx, _ = index.knn_query(queries, k=k)
+        elapsed_ms = (datetime.now() - start).total_seconds() * 1000 / len(queries)
+        recall = np.mean([
+            len(set(a) & set(e)) / k for a, e in zip(approx, exact)
+        ])
+        report.append({"ef": ef, "recall": float(recall), "latency_ms": elapsed_ms})
+        if logger:
+            logger.log(f"  ef={ef:<4} recall@{k}={recall:.3f}  latenza={elapsed_ms:.3f} ms/query")
+    return report
+
+
+def build_ann_index(embeddings, emb_dir=None, m=32, ef_construction=200, ef_search=128,
+                    recall_k=10, fingerprint=None, logger=None):
+    """
+    Costruisce l'indice HNSW (hnswlib, opzionale) accanto a cv_embeddings.npy.
+    
+    Parametri recall/latenza:
+        m: connessioni per nodo (più alto = recall migliore, indice più grande)
+        ef_construction: qualità della costruzione
+        ef_search: ampiezza della ricerca usata dall'app (salvata nel file .json)
+    
+    fingerprint (impronta del manifest, file_fingerprint) viene salvata nel
+    file .json: l'app usa l'indice solo se corrisponde al manifest corrente.
+    """
+    emb_dir = Path(emb_dir) if emb_dir else EMB_DIR
+    try:
+        import hnswlib
+    except ImportError:
+        if logger:
+            logger.log_warning("hnswlib non installato: indice ANN non creato (pip install hnswlib)")
+        return None
+    
+    if logger:
+        logger.log_section("CREAZIONE INDICE ANN (HNSW)")
+        logger.log(f"M={m}, ef_construction={ef_construction}, ef_search={ef_search}")
+    
+    data = np.asarray(embeddings, dtype=np.float32)
+    num_cvs, dim = data.shape
+    
+    index = hnswlib.Index(space='ip', dim=dim)
+    index.init_index(max_elements=num_cvs, M=m, ef_construction=ef_construction, random_seed=42)
+    index.add_items(data, np.arange(num_cvs))
+    index.save_index(str(emb_dir / ANN_INDEX_FILE))
+    
+    if logger:
+        logger.log(f"\nRecall@{recall_k} rispetto alla ricerca esatta:")
+    report = evaluate_ann_recall(index, data, k=recall_k, logger=logger)
+    
+    meta = {
+        "count": num_cvs,
+        "dim": dim,
+        "space": "ip",
+        "M": m,
+        "ef_construction": ef_construction,
+        "ef_search": ef_search,
+        "embeddings_fingerprint": fingerprint,
+        "recall_report": report
+    }
+    with open(emb_dir / ANN_META_FILE, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    
+    if logger:
+        logger.log_success(f"{ANN_INDEX_FILE} e {ANN_META_FILE} salvati")
+    return index
+
+
+def quantize_int8(embeddings):
+    """
+    Quantizzazione scalare int8 per dimensione (simmetrica).
+    
+    Ritorna (codes, scale) con embeddings ≈ codes * scale: 1 byte per
+    componente invece di 4 (float32).
+    """
+    data = np.asarray(embeddings, dtype=np.float32)
+    scale = np.abs(data).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(data / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def evaluate_int8_recall(embeddings, codes, scale, k=10, rerank_factor=10,
+                         num_queries=200, logger=None):
+    """Report recall@k della ricerca int8 (con e senza re-ranking esatto) vs ricerca esatta"""
+    data = np.asarray(embeddings, dtype=np.float32)
+    k = min(k, len(data))
+    shortlist_size = min(len(data), max(k * rerank_factor, 100))
+    rng = np.random.default_rng(42)
+    sample = rng.choice(len(data), size=min(num_queries, len(data)), replace=False)
+    exact = exact_top_k(data, data[sample], k)
+    
+    recall_codes, recall_rerank = [], []
+    for query, exact_top in zip(data[sample], exact):
+        approx_scores = score_int8(codes, scale, query)
+        shortlist = np.argpartition(-approx_scores, shortlist_size - 1)[:shortlist_size]
+        codes_top = shortlist[np.argsort(-approx_scores[shortlist])][:k]
+        reranked = shortlist[np.argsort(-(data[shortlist] @ query))][:k]
+        recall_codes.append(len(set(codes_top) & set(exact_top)) / k)
+        recall_rerank.append(len(set(reranked) & set(exact_top)) / k)
+    
+    report = {
+        "k": k,
+        "shortlist": shortlist_size,
+        "recall_int8": float(np.mean(recall_codes)),
+        "recall_int8_rerank": float(np.mean(recall_rerank))
+    }
+    if logger:
+        logger.log(f"  recall@{k} solo int8: {report['recall_int8']:.3f}")
+        logger.log(f"  recall@{k} int8 + re-ranking esatto (shortlist {shortlist_size}): "
+                   f"{report['recall_int8_rerank']:.3f}")
+    return report
+
+
+def build_quantized_index(embeddings, emb_dir=None, rerank_factor=10, logger=None):
+    """
+    Salva cv_embeddings_int8.npy (codici) e cv_embeddings_int8.json (scale,
+    parametri e report di recall) per la ricerca su laptop con poca RAM.
+    """
+    emb_dir = Path(emb_dir) if emb_dir else EMB_DIR
+    if logger:
+        logger.log_section("QUANTIZZAZIONE INT8 DEGLI EMBEDDINGS")
+    
+    codes, scale = quantize_int8(embeddings)
+    np.save(str(emb_dir / INT8_CODES_FILE), codes)
+    
+    float_bytes = np.asarray(embeddings).size * 4
+    if logger:
+        logger.log(f"Dimensione: {codes.nbytes / 1e6:.1f} MB (float32: {float_bytes / 1e6:.1f} MB, "
+                   f"{float_bytes / codes.nbytes:.0f}x)")
+        logger.log("Recall rispetto alla ricerca esatta:")
+    report = evaluate_int8_recall(embeddings, codes, scale, rerank_factor=rerank_factor, logger=logger)
+    
+    meta = {
+        "count": int(codes.shape[0]),
+        "dim": int(codes.shape[1]),
+        "scale": scale.tolist(),
+        "rerank_factor": rerank_factor,
+        "recall_report": report
+    }
+    with open(emb_dir / INT8_META_FILE, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    
+    if logger:
+        logger.log_success(f"{INT8_CODES_FILE} e {INT8_META_FILE} salvati")
+    return codes, scale
+
+
 def main():
-    logger = EmbeddingLogger()
+    logger = EmbeddingLogger(level=get_cli_option("log-level", "INFO"))
     
     logger.log("="*80)
     logger.log("CREAZIONE EMBEDDINGS PESATI MULTI-SEZIONE")
@@ -440,7 +859,7 @@ def main():
         logger.log_error("Impossibile caricare i CV. Uscita.")
         return
     
-    cv_sections_list, cv_labels, cv_json_names = result
+    cv_sections_list, cv_labels, cv_json_names, cv_file_hashes, cv_metadata = result
     
     if not cv_sections_list:
         logger.log_error("Nessun CV da processare. Uscita.")
@@ -451,24 +870,58 @@ def main():
     for i, (label, json_name) in enumerate(zip(cv_labels, cv_json_names), 1):
         logger.log(f"  {i}. {label} (file: {json_name}.json)")
     
-    # Carica modello
-    logger.log_section("CARICAMENTO MODELLO BGE-M3")
-    try:
-        logger.log("Inizializzazione modello...")
-        model = BGEM3FlagModel('BAAI/bge-m3', use_fp16=True)
-        logger.log_success("Modello caricato con successo!")
-    except Exception as e:
-        logger.log_error(f"Impossibile caricare il modello: {e}")
-        return
+    # Cache condivisa testo → embedding (usata anche da cv_search_app_v1.py)
+    text_cache = SectionEmbeddingCache(EMB_DIR / SECTION_CACHE_FILE, MODEL_NAME)
+    
+    # Rebuild incrementale: riusa le sezioni invariate (usa --full per ricalcolare tutto)
+    if "--full" in sys.argv[1:]:
+        logger.log("Opzione --full: rebuild completo (manifest e cache ignorati)")
+        cached_by_section = None
+        text_cache.clear()
+    else:
+        cached_by_section = load_cached_section_embeddings(
+            cv_sections_list, cv_json_names, cv_file_hashes, logger=logger
+        )
+    
+    pending_texts = {text for _, _, text in pending_section_texts(cv_sections_list, cached_by_section)}
+    # Una sola lettura della cache: i risultati passano a create_weighted_embeddings
+    cached_texts = text_cache.get_many(pending_texts)
+    needs_encoding = len(cached_texts) < len(pending_texts)
+    
+    # Carica modello (solo se c'è almeno un testo mai codificato)
+    model = None
+    if needs_encoding:
+        logger.log_section("CARICAMENTO MODELLO BGE-M3")
+        try:
+            # Server di embedding attivo (embedding_server.py): usa quello
+            model = RemoteBGEM3Model.connect(MODEL_NAME)
+            if model is not None:
+                logger.log_success(f"Uso il server di embedding {model.base_url}")
+            else:
+                logger.log("Inizializzazione modello...")
+                from FlagEmbedding import BGEM3FlagModel
+                model = BGEM3FlagModel(MODEL_NAME, use_fp16=True)
+                logger.log_success("Modello caricato con successo!")
+        except Exception as e:
+            logger.log_error(f"Impossibile caricare il modello: {e}")
+            return
+    else:
+        logger.log_success("Nessun testo nuovo da codificare: modello non necessario")
     
     # Crea embeddings pesati
     start_time = datetime.now()
     
+    weights = {'skills': 0.40, 'experience': 0.40, 'education': 0.15, 'summary': 0.05}
     embeddings_final, embeddings_by_section = create_weighted_embeddings(
         cv_sections_list, 
         model, 
-        logger=logger
+        weights=weights,
+        logger=logger,
+        cached_by_section=cached_by_section,
+        text_cache=text_cache,
+        cached_texts=cached_texts
     )
+    text_cache.close()
     
     end_time = datetime.now()
     elapsed = (end_time - start_time).total_seconds()
@@ -477,12 +930,17 @@ def main():
     
     # Salva file
     logger.log_section("SALVATAGGIO FILE NPY")
-    EMB_DIR = BASE_DIR / "input" / "embeddings"
     EMB_DIR.mkdir(exist_ok=True, parents=True)
     try:
-        # Embeddings finali pesati
-        np.save(str(EMB_DIR / 'cv_embeddings.npy'), embeddings_final)
-        logger.log_success("cv_embeddings.npy salvato (weighted final)")
+        # Il manifest viene invalidato prima di sovrascrivere gli array
+        (EMB_DIR / MANIFEST_FILE).unlink(missing_ok=True)
+        
+        # Embeddings finali pesati: array contiguo float32 (float16 con --float16),
+        # aperto dall'app con mmap_mode='r' senza copia in RAM
+        index_dtype = np.float16 if "--float16" in sys.argv[1:] else np.float32
+        np.save(str(EMB_DIR / 'cv_embeddings.npy'),
+                np.ascontiguousarray(embeddings_final, dtype=index_dtype))
+        logger.log_success(f"cv_embeddings.npy salvato (weighted final, {np.dtype(index_dtype).name})")
         
         # Salva anche embeddings per sezione (per analisi avanzate)
         for section, emb in embeddings_by_section.items():
@@ -498,6 +956,9 @@ def main():
         np.save(str(EMB_DIR / 'cv_json_names.npy'), np.array(cv_json_names))
         logger.log_success("cv_json_names.npy salvato")
         
+        # Metadati colonnari + bitmap per i filtri Office/Level
+        save_metadata_sidecar(cv_metadata, logger=logger)
+        
         # Salva anche le sezioni testuali per riferimento
         cv_texts_full = []
         for sections in cv_sections_list:
@@ -507,10 +968,42 @@ def main():
         np.save(str(EMB_DIR / 'cv_texts.npy'), np.array(cv_texts_full))
         logger.log_success("cv_texts.npy salvato")
         
+        # Manifest per il rebuild incrementale (scritto per ultimo)
+        manifest = build_manifest(cv_sections_list, cv_json_names, cv_file_hashes, weights)
+        with open(EMB_DIR / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        logger.log_success(f"{MANIFEST_FILE} salvato")
+        
     except Exception as e:
         logger.log_error(f"Errore durante il salvataggio: {e}")
         return
     
+    # Indice ANN opzionale per pool molto grandi (--ann, richiede hnswlib).
+    # Quello di una build precedente non è più allineato alle righe: viene
+    # sempre eliminato, anche se la nuova costruzione non riesce
+    (EMB_DIR / ANN_INDEX_FILE).unlink(missing_ok=True)
+    (EMB_DIR / ANN_META_FILE).unlink(missing_ok=True)
+    if "--ann" in sys.argv[1:]:
+        build_ann_index(
+            embeddings_final,
+            m=get_cli_option("ann-m", 32),
+            ef_construction=get_cli_option("ann-ef-construction", 200),
+            ef_search=get_cli_option("ann-ef", 128),
+            fingerprint=file_fingerprint(EMB_DIR / MANIFEST_FILE),
+            logger=logger
+        )
+    
+    # Indice compresso int8 opzionale per laptop con poca RAM (--quantize)
+    if "--quantize" in sys.argv[1:]:
+        build_quantized_index(
+            embeddings_final,
+            rerank_factor=get_cli_option("rerank-factor", 10),
+            logger=logger
+        )
+    else:
+        (EMB_DIR / INT8_CODES_FILE).unlink(missing_ok=True)
+        (EMB_DIR / INT8_META_FILE).unlink(missing_ok=True)
+    
     # Riepilogo finale
     logger.log_section("ESECUZIONE COMPLETATA CON SUCCESSO")
     logger.log(f"Numero di CV processati: {len(cv_sections_list)}")
@@ -523,7 +1016,7 @@ def main():
     logger.log(f"  - Education + Certifications: 15%")
     logger.log(f"  - Summary + Title: 5%")
     logger.log(f"\nFile NPY creati:")
-    logger.log(f"  - cv_embeddings.npy (embeddings finali pesati)")
+    logger.log(f"  - cv_embeddings.npy (embeddings finali pesati, normalizzati L2)")
     logger.log(f"  - cv_embeddings_skills.npy (solo skills)")
     logger.log(f"  - cv_embeddings_experience.npy (solo experience)")
     logger.log(f"  - cv_embeddings_education.npy (solo education)")
@@ -531,6 +1024,13 @@ def main():
     logger.log(f"  - cv_labels.npy")
     logger.log(f"  - cv_json_names.npy")
     logger.log(f"  - cv_texts.npy")
+    logger.log(f"  - {METADATA_FILE} (Office, Level, title + bitmap per i filtri)")
+    logger.log(f"  - {MANIFEST_FILE} (hash per rebuild incrementale)")
+    logger.log(f"  - {SECTION_CACHE_FILE} (cache testo → embedding condivisa)")
+    if "--ann" in sys.argv[1:]:
+        logger.log(f"  - {ANN_INDEX_FILE} + {ANN_META_FILE} (indice ANN, se hnswlib è installato)")
+    if "--quantize" in sys.argv[1:]:
+        logger.log(f"  - {INT8_CODES_FILE} + {INT8_META_FILE} (indice compresso int8)")
     
     # Menu visualizzazioni
     logger.log_section("OPZIONI VISUALIZZAZIONE")
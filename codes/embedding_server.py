@@ -0,0 +1,117 @@
+# embedding_server.py
+"""
+Server locale di embedding BGE-M3 (opzionale).
+
+Tiene BGE-M3 caricato in memoria e codifica i testi per
+cv_search_app_v1.py e rag_bge-m3_v2.py. Se il server è attivo, i due
+script lo usano invece di caricare il modello nel proprio processo: l'app
+è pronta subito e più sessioni sulla stessa macchina condividono una sola
+copia del modello. Se non risponde, caricano il modello come prima.
+
+AVVIO:
+python codes/embedding_server.py [--port=8765] [--host=127.0.0.1] [--model=BAAI/bge-m3]
+
+API (solo localhost per default, nessuna autenticazione):
+GET  /health  → {"status": "ok", "model": "BAAI/bge-m3"}
+POST /encode  {"texts": [...], "batch_size": 12, "max_length": 8192}
+              → corpo binario float32 (righe × dimensione), header X-Rows e X-Dim
+"""
+
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from common import get_cli_option
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MODEL_NAME = 'BAAI/bge-m3'
+
+
+def log(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    """Gestisce /health e /encode; il modello è condiviso dal server"""
+
+    def log_message(self, format, *args):
+        pass  # log delle richieste gestito in do_POST
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "model": self.server.model_name})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/encode":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            texts = [str(text) for text in request["texts"]]
+            batch_size = int(request.get("batch_size", 12))
+            max_length = int(request.get("max_length", 8192))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {"error": f"richiesta non valida: {e}"})
+            return
+
+        try:
+            start = datetime.now()
+            # Un encode alla volta: il modello (GPU/CPU) è condiviso
+            with self.server.model_lock:
+                dense = self.server.model.encode(texts, batch_size=max(1, batch_size),
+                                                 max_length=max_length)['dense_vecs']
+            vectors = np.ascontiguousarray(np.asarray(dense, dtype=np.float32).reshape(len(texts), -1))
+            log(f"encode: {len(texts)} testi in {(datetime.now() - start).total_seconds():.2f} s")
+        except Exception as e:
+            log(f"Errore encode: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+
+        body = vectors.tobytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Rows", str(vectors.shape[0]))
+        self.send_header("X-Dim", str(vectors.shape[1]))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    host = get_cli_option("host", DEFAULT_HOST)
+    port = get_cli_option("port", DEFAULT_PORT)
+    model_name = get_cli_option("model", MODEL_NAME)
+
+    log(f"Caricamento modello {model_name}...")
+    from FlagEmbedding import BGEM3FlagModel
+    model = BGEM3FlagModel(model_name, use_fp16=True)
+
+    server = ThreadingHTTPServer((host, port), EmbeddingRequestHandler)
+    server.model = model
+    server.model_name = model_name
+    server.model_lock = threading.Lock()
+    log(f"Server di embedding pronto su http://{host}:{port} (Ctrl+C per fermarlo)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("Server fermato")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "codes"))
+
+from cv_search_app_v1 import CVSearchApp, is_placeholder_value  # noqa: E402
+
+
+def make_app(offices, levels):
+    """CVSearchApp senza UI, con embeddings e metadati Office/Level in memoria"""
+    app = CVSearchApp.__new__(CVSearchApp)
+    num_cvs = len(offices)
+    embeddings = np.eye(num_cvs, 4, dtype=np.float32)
+    app.cv_embeddings = embeddings
+    app.ann_index = None
+    app.int8_codes = None
+    app.metadata = {}
+    for column, column_values in [("office", offices), ("level", levels)]:
+        normalized = np.array([v.casefold() for v in column_values])
+        values = sorted(set(normalized))
+        app.metadata[f"{column}_values"] = np.array(values)
+        app.metadata[f"{column}_bitmaps"] = np.array([np.packbits(normalized == v) for v in values])
+    return app
+
+
+def test_placeholder_values():
+    assert is_placeholder_value("")
+    assert is_placeholder_value("...")
+    assert is_placeholder_value(" - ")
+    assert not is_placeholder_value("Milano")
+
+
+def test_default_prefilled_query_returns_candidates():
+    app = make_app(["Milano", "Roma", "Torino"], ["Senior", "Junior", "Senior"])
+    query = "Skills: Python, SQL\nIndustry: ...\nOffice: ...\n Level: ... "
+
+    query_json = app.parse_query_to_json(query)
+    assert query_json["skills"] == ["Python", "SQL"]
+    assert query_json["office"] == ""
+    assert query_json["level"] == ""
+    assert query_json["summary"] == ""
+
+    mask, description = app.build_filter_mask(query_json)
+    assert mask is None and description is None
+
+    rows, scores = app.search_candidates(np.ones((1, 4), dtype=np.float32), 3, mask=mask)
+    assert len(rows) == 3
+
+
+def test_office_level_filters_still_apply():
+    app = make_app(["Milano", "Roma", "Torino"], ["Senior", "Junior", "Senior"])
+    query_json = app.parse_query_to_json("Skills: Python\nOffice: Milano, Torino, ...\nLevel: senior")
+
+    mask, description = app.build_filter_mask(query_json)
+    assert mask.tolist() == [True, False, True]
+    assert "office=Milano, Torino, ..." in description
+
+    rows, _ = app.search_candidates(np.ones((1, 4), dtype=np.float32), 5, mask=mask)
+    assert sorted(rows.tolist()) == [0, 2]